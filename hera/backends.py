@@ -0,0 +1,166 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module provides the backends models are exported to.
+
+A backend turns a model and an assignment into an exported model:
+    'ethics' -- A CausalModel of the ethics module (the reasoner). The module
+                is only imported on the first export, so that processes which
+                only build or edit models do not pay for importing it.
+    'native' -- A NativeModel, which evaluates the model without any further
+                dependency.
+
+Further backends are added to BACKENDS.
+'''
+import os
+import tempfile
+
+import stats
+
+DEFAULT_BACKEND = 'ethics'
+
+
+class Backend:
+    '''This class represents a backend models are exported to.'''
+    name = None
+
+    def load(self):
+        '''Load everything the backend needs, so that the first export is not
+        slowed down by it. This is done by the first export otherwise.'''
+
+    def export(self, model, assignment):
+        '''Export a model under an assignment, which is already verified.
+
+        Arguments:
+        model -- The model to be exported
+        assignment -- A dictionary that assigns each action and background
+                      condition a truth value
+        '''
+        raise NotImplementedError
+
+
+class EthicsBackend(Backend):
+    '''This class represents the export to CausalModels of the ethics
+    module.'''
+    name = 'ethics'
+
+    def __init__(self):
+        '''Initialize the backend without importing the ethics module.'''
+        self.__causal_model = None
+
+    def load(self):
+        '''Import the ethics module.
+        Raise an ImportError, if it is not installed.
+        '''
+        if self.__causal_model is None:
+            with stats.measure('backends.ethics.import'):
+                from ethics.semantics import CausalModel
+            self.__causal_model = CausalModel
+
+    def export(self, model, assignment):
+        '''Export a model as CausalModel of the ethics module.'''
+        self.load()
+
+        # Export model to temporary json file, which is unique, so that
+        # models can be exported concurrently
+        with stats.measure('Model.export.serialize'):
+            content = repr(model)
+
+        with stats.measure('Model.export.write'):
+            tmp_fd, filename = tempfile.mkstemp(suffix='.json')
+            with os.fdopen(tmp_fd, 'w') as tmp_file:
+                tmp_file.write(content)
+
+        # Initialize a CausalModel with the json file
+        try:
+            with stats.measure('Model.export.build'):
+                return self.__causal_model(filename, assignment)
+        finally:
+            # Remove the temporary file
+            with stats.measure('Model.export.cleanup'):
+                os.remove(filename)
+
+
+class NativeModel:
+    '''This class represents a model evaluated under an assignment without
+    the reasoner.'''
+    def __init__(self, values, utilities, intentions):
+        '''Initialize the evaluated model.
+
+        Arguments:
+        values -- A dictionary which maps every action, background condition
+                  and consequence to 1, if it holds, and to 0 otherwise
+        utilities -- A dictionary which maps every consequence to the pair of
+                     the utilities of reaching and of not reaching it
+        intentions -- A dictionary which maps every action to the list of its
+                      intended consequences
+        '''
+        self.__values = values
+        self.__utilities = utilities
+        self.__intentions = intentions
+
+    def holds(self, variable):
+        '''Return True, if a variable holds under the assignment.'''
+        return bool(self.__values[variable])
+
+    def get_values(self):
+        '''Get a copy of the truth values of all variables.'''
+        return dict(self.__values)
+
+    def get_utility(self):
+        '''Get the total utility, i.e. the sum of the utilities of the
+        consequences which hold and of not reaching the other consequences.
+        Utilities which are not set count as 0.
+        '''
+        return sum(pair[0 if self.__values[consequence] else 1] or 0
+                   for consequence, pair in self.__utilities.items())
+
+    def get_intended_consequences(self):
+        '''Get the consequences which hold and are intended by an action which
+        is performed, as a dictionary which maps these actions to their
+        consequences.'''
+        return {action: [consequence for consequence in intended
+                         if consequence != action
+                         and self.__values.get(consequence)]
+                for action, intended in self.__intentions.items()
+                if self.__values.get(action)}
+
+
+class NativeBackend(Backend):
+    '''This class represents the export to NativeModels.'''
+    name = 'native'
+
+    def export(self, model, assignment):
+        '''Export a model as NativeModel.'''
+        with stats.measure('Model.export.evaluate'):
+            values = dict(assignment)
+            values.update(model.evaluate(assignment))
+
+        return NativeModel(values, model.get_utility_pairs(),
+                           model.get_intentions())
+
+
+BACKENDS = {
+    EthicsBackend.name: EthicsBackend(),
+    NativeBackend.name: NativeBackend(),
+    }
+
+
+def get_backend(backend=None):
+    '''Get a backend by its name. Backend objects are returned unchanged.
+    Raise a KeyError, if there is no backend with the name.
+
+    Arguments:
+    backend -- The name of the backend or a backend (the default backend, if
+               None)
+    '''
+    if backend is None:
+        backend = DEFAULT_BACKEND
+
+    if isinstance(backend, Backend):
+        return backend
+
+    if backend not in BACKENDS:
+        raise KeyError('{} is no backend.'.format(backend))
+
+    return BACKENDS[backend]
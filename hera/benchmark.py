@@ -0,0 +1,377 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module benchmarks the operations of hera models on synthetic models of
+growing size.
+
+Run it with
+    python3 benchmark.py --output baseline.json
+to save a baseline and with
+    python3 benchmark.py --compare baseline.json
+to compare a new run against it.
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from model import Model
+import snapshot
+
+SIZES = [10, 100, 1000, 10000, 100000]
+WIDTHS = [2, 8]
+DEPTHS = [1, 4]
+
+# Number of new items added by the add_* operations
+BATCH = 100
+
+# Statements whose cold start (in a new interpreter) is measured
+COLD_STARTS = {
+    'import_model': 'import model',
+    'import_server': 'import server',
+    'import_ethics': 'import ethics.semantics',
+    'first_export': ('import model; m = model.Model(""); m.add_actions("a"); '
+                     'm.export({"a": 1})'),
+    }
+
+
+def generate_model(variables, width, depth, seed=0):
+    '''Generate a random model with a given number of variables.
+    A tenth of the variables are actions, a fifth background conditions and
+    the rest consequences. The consequences are split into layers, where the
+    mechanisms of each layer depend on the layer before.
+
+    The parts are assigned directly (like in the unit tests), since building
+    large models through the add_* methods would dominate the benchmark.
+
+    Arguments:
+    variables -- The total number of variables
+    width -- The number of variables in every mechanism
+    depth -- The number of layers of consequences
+    seed -- The seed of the random number generator
+    '''
+    rng = random.Random(seed)
+
+    num_actions = max(1, variables // 10)
+    num_background = max(1, variables // 5)
+    num_consequences = max(1, variables - num_actions - num_background)
+
+    actions = ['a{}'.format(i) for i in range(num_actions)]
+    background = ['b{}'.format(i) for i in range(num_background)]
+    consequences = ['c{}'.format(i) for i in range(num_consequences)]
+
+    mechanisms = {}
+    pool = actions + background
+    layer_size = -(-num_consequences // depth)
+    for start in range(0, num_consequences, layer_size):
+        layer = consequences[start:start + layer_size]
+        for consequence in layer:
+            mechanisms[consequence] = rng.sample(pool, min(width, len(pool)))
+        pool = pool + layer
+
+    utilities = {consequence: [rng.randint(-10, 10), rng.randint(-10, 10)]
+                 for consequence in consequences}
+
+    intentions = {}
+    for action in actions:
+        intentions[action] = [action]
+        if rng.random() < 0.5:
+            intentions[action].append(rng.choice(consequences))
+
+    model = Model('Benchmark model with {} variables'.format(variables))
+    model._Model__actions = actions
+    model._Model__background = background
+    model._Model__consequences = consequences
+    model._Model__mechanisms = mechanisms
+    model._Model__utilities = utilities
+    model._Model__intentions = intentions
+
+    return model
+
+
+def operations(model):
+    '''Return the benchmarked operations on a generated model as a list of
+    pairs of names and functions. The operations are meant to be run in order,
+    since the later ones use and undo changes of the earlier ones (see
+    prerequisites()).
+    '''
+    actions = model.get_actions()
+    new_actions = ['new_a{}'.format(i) for i in range(BATCH)]
+    new_background = ['new_b{}'.format(i) for i in range(BATCH)]
+    new_consequences = ['new_c{}'.format(i) for i in range(BATCH)]
+    action = actions[0]
+    bg_condition = model.get_background()[0]
+    consequence = model.get_consequences()[-1]
+    snapshots = {}
+
+    def dump_snapshot():
+        snapshots['data'] = snapshot.dumps(model)
+
+    def load_snapshot():
+        # Load the snapshot of the dump_snapshot operation
+        snapshot.loads(snapshots['data'])
+
+    def assignment():
+        # Assign the current actions and background conditions a value
+        values = dict.fromkeys(model.get_actions()
+                               + model.get_background(), 0)
+        values[model.get_actions()[0]] = 1
+        return values
+
+    return [
+        ('add_actions', lambda: model.add_actions(*new_actions)),
+        ('add_background', lambda: model.add_background(*new_background)),
+        ('add_consequences',
+         lambda: model.add_consequences(*new_consequences)),
+        ('add_mechanisms',
+         lambda: model.add_mechanisms(new_consequences[0], *new_actions)),
+        ('set_utility', lambda: model.set_utility(consequence, 42)),
+        ('add_intentions',
+         lambda: model.add_intentions(action, *new_consequences)),
+        ('rename_action', lambda: model.rename_action(action, 'renamed')),
+        ('rename_background',
+         lambda: model.rename_background(bg_condition, 'renamed_b')),
+        ('rename_consequence',
+         lambda: model.rename_consequence(consequence, 'renamed_c')),
+        ('repr', lambda: repr(model)),
+        ('dump_snapshot', dump_snapshot),
+        ('load_snapshot', load_snapshot),
+        ('check', model.check),
+        ('remove_mechanisms',
+         lambda: model.remove_mechanisms(new_consequences[0], *new_actions)),
+        ('remove_intentions',
+         lambda: model.remove_intentions('renamed', *new_consequences)),
+        ('remove_actions', lambda: model.remove_actions(*new_actions)),
+        ('remove_background', lambda: model.remove_background(*new_background)),
+        ('remove_consequences',
+         lambda: model.remove_consequences(*new_consequences)),
+        ('evaluate', lambda: model.evaluate(assignment())),
+        ('estimate', lambda: model.estimate(actions=[model.get_actions()[0]],
+                                            max_samples=BATCH * 10,
+                                            seed=0)),
+        ('export', lambda: model.export(assignment())),
+        ]
+
+
+def prerequisites(operations, selected=None):
+    '''Return the operations up to the last selected one as a list of triples
+    of names, functions and whether the operation is timed. Operations which
+    are not selected are run without timing them, so that every selected
+    operation finds the model changed as in a run of all operations.
+
+    Arguments:
+    operations -- The list of pairs of names and functions of operations()
+    selected -- The names of the operations to time (all, if None)
+    '''
+    if not selected:
+        return [(name, function, True) for name, function in operations]
+
+    timed = [name in selected for name, _ in operations]
+    if True not in timed:
+        return []
+
+    last = len(timed) - timed[::-1].index(True)
+    return [(name, function, is_timed) for (name, function), is_timed
+            in zip(operations[:last], timed)]
+
+
+def measure(function, trace_memory):
+    '''Run a function and return the elapsed time in seconds and the peak of
+    the memory allocated meanwhile in bytes (None, if it is not traced).
+    '''
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def run(sizes, widths, depths, selected=None, repeat=1, seed=0):
+    '''Run the benchmark and return the results as a list of dictionaries.
+    Every operation is timed repeat times (the minimum is reported) and run
+    once more with traced memory to determine the peak memory.
+
+    Arguments:
+    sizes -- The numbers of variables of the generated models
+    widths -- The widths of the mechanisms of the generated models
+    depths -- The depths of the generated models
+    selected -- The names of the operations to run (all, if None)
+    repeat -- The number of timed runs
+    seed -- The seed of the model generator
+    '''
+    results = []
+    for variables in sizes:
+        for width in widths:
+            for depth in depths:
+                runs = {}
+                for run_index in range(repeat + 1):
+                    trace_memory = run_index == repeat
+                    model = generate_model(variables, width, depth, seed)
+
+                    for name, function, timed in prerequisites(
+                            operations(model), selected):
+                        if not timed:
+                            function()
+                            continue
+
+                        try:
+                            elapsed, peak = measure(function, trace_memory)
+                        except ImportError as error:
+                            # The reasoner backend is not installed
+                            print('Skipping {}: {}'.format(name, error),
+                                  file=sys.stderr)
+                            continue
+
+                        entry = runs.setdefault(name, {
+                            'operation': name,
+                            'variables': variables,
+                            'width': width,
+                            'depth': depth,
+                            'seconds': elapsed,
+                            'peak_bytes': None,
+                            })
+                        if trace_memory:
+                            entry['peak_bytes'] = peak
+                        else:
+                            entry['seconds'] = min(entry['seconds'], elapsed)
+
+                for entry in runs.values():
+                    print('{operation:>20} n={variables:<7} w={width:<3} '
+                          'd={depth:<3} {seconds:10.6f}s {peak_bytes:>12}B'
+                          .format(**entry), file=sys.stderr)
+                    results.append(entry)
+
+    return results
+
+
+def cold_start(selected=None, repeat=1):
+    '''Measure the time of statements in new interpreters and return the
+    results in the form of the results of run(). The time of the interpreter
+    itself is subtracted.
+
+    Arguments:
+    selected -- The names of the statements to run (all, if None)
+    repeat -- The number of timed runs (the minimum is reported)
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    def seconds(statement):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', statement], cwd=directory,
+                           check=True, stderr=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    interpreter = seconds('pass')
+
+    results = []
+    for name, statement in COLD_STARTS.items():
+        if selected and name not in selected:
+            continue
+
+        try:
+            elapsed = seconds(statement) - interpreter
+        except subprocess.CalledProcessError:
+            # The reasoner backend is not installed
+            print('Skipping {}: the statement failed'.format(name),
+                  file=sys.stderr)
+            continue
+
+        entry = {
+            'operation': name,
+            'variables': 0,
+            'width': 0,
+            'depth': 0,
+            'seconds': max(elapsed, 0.0),
+            'peak_bytes': None,
+            }
+        print('{operation:>20} cold start {seconds:10.6f}s'.format(**entry),
+              file=sys.stderr)
+        results.append(entry)
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''Compare results with a baseline and return the entries which got slower
+    by more than a factor of threshold as a list of tuples.
+    '''
+    def key(entry):
+        return (entry['operation'], entry['variables'], entry['width'],
+                entry['depth'])
+
+    baseline_seconds = {key(entry): entry['seconds']
+                        for entry in baseline['results']}
+
+    regressions = []
+    for entry in results:
+        old = baseline_seconds.get(key(entry))
+        if old and entry['seconds'] > threshold * old:
+            regressions.append(key(entry) + (old, entry['seconds']))
+
+    return regressions
+
+
+def main():
+    '''Parse the command line arguments and run the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--widths', type=int, nargs='+', default=WIDTHS)
+    parser.add_argument('--depths', type=int, nargs='+', default=DEPTHS)
+    parser.add_argument('--operations', nargs='+',
+                        help='only run these operations')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the results as json file')
+    parser.add_argument('--compare', help='compare with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='slowdown factor reported as regression')
+    parser.add_argument('--no-cold-start', action='store_true',
+                        help='do not measure the cold start times')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.widths, args.depths, args.operations,
+                  args.repeat, args.seed)
+    if not args.no_cold_start:
+        results += cold_start(args.operations, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'results': results,
+                }, output_file, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  args.threshold)
+
+        for operation, variables, width, depth, old, new in regressions:
+            print('Regression: {} n={} w={} d={} {:.6f}s -> {:.6f}s'
+                  .format(operation, variables, width, depth, old, new))
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module provides a least recently used cache for results derived from
+hera models, e.g. exported or evaluated models.'''
+from collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    '''This class represents a cache with a bounded number of entries which
+    evicts the least recently used entry when it is full. Optionally, entries
+    expire a fixed time after they were put into the cache.
+    The cache may be used by several threads at the same time, e.g. by the
+    readers of a shared model.
+    '''
+    def __init__(self, maxsize=128, ttl=None):
+        '''Initialize the cache.
+
+        Arguments:
+        maxsize -- The maximal number of entries in the cache
+        ttl -- The number of seconds after which an entry expires (never, if
+               None)
+        '''
+        if not isinstance(maxsize, int):
+            raise TypeError('The size of a cache must be an integer value.')
+        if maxsize < 1:
+            raise ValueError('The size of a cache must be positive.')
+        if ttl is not None and not isinstance(ttl, (int, float)):
+            raise TypeError('The time to live must be a number.')
+        if ttl is not None and ttl <= 0:
+            raise ValueError('The time to live must be positive.')
+
+        self.__maxsize = maxsize
+        self.__ttl = ttl
+        self.__lock = threading.Lock()
+
+        # Every key maps to a pair of the value and the time it expires at, in
+        # the order of their use
+        self.__entries = OrderedDict()
+
+        # The keys of the entries in the order they were put into the cache,
+        # which is the order in which they expire, since the time to live is
+        # the same for all entries
+        self.__expiry = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+
+    def __len__(self):
+        '''Return the number of entries in the cache.'''
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        '''Return True, if there is an entry for a key in the cache.
+        This does not count as a use of the entry.
+        '''
+        with self.__lock:
+            return key in self.__entries and not self.__is_expired(key)
+
+    def get(self, key, default=None):
+        '''Get the value of an entry and mark it as recently used.
+        Return the default value, if there is no entry for the key.
+
+        Arguments:
+        key -- The key of the entry
+        default -- The value returned on a cache miss
+        '''
+        with self.__lock:
+            if key in self.__entries and self.__is_expired(key):
+                self.__remove(key)
+                self.__expirations += 1
+
+            if key not in self.__entries:
+                self.__misses += 1
+                return default
+
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+
+            return self.__entries[key][0]
+
+    def put(self, key, value):
+        '''Add or replace an entry.
+        If the cache is full, the least recently used entry is evicted.
+
+        Arguments:
+        key -- The key of the entry
+        value -- The value of the entry
+        '''
+        with self.__lock:
+            expires = None
+            if self.__ttl is not None:
+                expires = time.monotonic() + self.__ttl
+
+                # Drop all expired entries in the order they expire, so that
+                # they do not occupy memory until they are evicted
+                while self.__expiry and self.__is_expired(next(iter(
+                        self.__expiry))):
+                    self.__remove(next(iter(self.__expiry)))
+                    self.__expirations += 1
+
+                self.__expiry[key] = None
+                self.__expiry.move_to_end(key)
+
+            self.__entries[key] = (value, expires)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__maxsize:
+                self.__remove(next(iter(self.__entries)))
+                self.__evictions += 1
+
+    def clear(self):
+        '''Remove all entries from the cache. The counters stay unchanged.'''
+        with self.__lock:
+            self.__entries.clear()
+            self.__expiry.clear()
+
+    def get_maxsize(self):
+        '''Get the maximal number of entries in the cache.'''
+        return self.__maxsize
+
+    def get_ttl(self):
+        '''Get the number of seconds after which an entry expires (None, if
+        entries never expire).'''
+        return self.__ttl
+
+    def get_stats(self):
+        '''Get the hit, miss, eviction and expiration counters and the current
+        size of the cache.
+        '''
+        with self.__lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'evictions': self.__evictions,
+                'expirations': self.__expirations,
+                'size': len(self.__entries),
+                'maxsize': self.__maxsize,
+                }
+
+    def __remove(self, key):
+        '''Remove the entry of a key.'''
+        del self.__entries[key]
+        self.__expiry.pop(key, None)
+
+    def __is_expired(self, key):
+        '''Return True, if the entry of a key is expired.'''
+        expires = self.__entries[key][1]
+        return expires is not None and expires <= time.monotonic()
@@ -0,0 +1,390 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module provides an asyncio client for the protocol specified in
+messages.md.
+
+The client keeps a pool of connections to a server, allocates the ids of the
+request messages and matches the replies by their reply_to field, so that
+many requests can be in flight at the same time:
+    async with Client('localhost', 9000) as client:
+        await client.add_actions('A1', 'A2')
+        actions = await client.get_actions()
+
+Benchmark the client against a running server with
+    python3 client.py --server localhost:9000 --requests 10000
+'''
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from loadtest import parse_address, summarize
+
+
+class _Connection:
+    '''This class represents a connection of the pool. It sends requests and
+    resolves the futures of the pending requests with the replies.'''
+    def __init__(self, reader, writer):
+        '''Initialize the connection with the streams of an open socket.'''
+        self.__reader = reader
+        self.__writer = writer
+        self.__pending = {}
+        self.__receiver = asyncio.ensure_future(self.__receive())
+
+    def get_load(self):
+        '''Get the number of requests waiting for a reply.'''
+        return len(self.__pending)
+
+    def is_closed(self):
+        '''Return True, if the connection was closed.'''
+        return self.__receiver.done()
+
+    async def request(self, message, timeout):
+        '''Send a request message and return the result of the reply.
+        Raise asyncio.TimeoutError, if there is no reply within the timeout.
+        '''
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[message['id']] = future
+
+        try:
+            self.__writer.write((json.dumps(message) + '\n').encode())
+            await self.__writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.__pending.pop(message['id'], None)
+
+    async def close(self):
+        '''Close the connection. Pending requests fail with a
+        ConnectionError.'''
+        self.__writer.close()
+        try:
+            await self.__writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.__receiver
+
+    async def __receive(self):
+        '''Resolve the pending requests with the received replies, in
+        whatever order they arrive.'''
+        try:
+            while True:
+                line = await self.__reader.readline()
+                if not line:
+                    break
+
+                query = json.loads(line.decode())['query']
+                future = self.__pending.get(query['reply_to'])
+
+                # Replies to requests which timed out are dropped
+                if future is not None and not future.done():
+                    future.set_result(query['result'])
+        except (ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            for future in self.__pending.values():
+                if not future.done():
+                    future.set_exception(
+                        ConnectionError('The connection was closed.'))
+
+
+class Client:
+    '''This class represents a client of a hera server with a pool of
+    connections.'''
+    def __init__(self, host='localhost', port=9000, pool_size=4, timeout=10.0):
+        '''Initialize the client. The connections are opened on the first
+        request.
+
+        Arguments:
+        host -- The host of the server
+        port -- The port of the server
+        pool_size -- The maximal number of connections
+        timeout -- The default number of seconds to wait for a reply
+        '''
+        if not isinstance(pool_size, int):
+            raise TypeError('The size of a pool must be an integer value.')
+        if pool_size < 1:
+            raise ValueError('The size of a pool must be positive.')
+
+        self.__address = (host, port)
+        self.__pool_size = pool_size
+        self.__timeout = timeout
+        self.__connections = []
+        self.__message_ids = itertools.count(1)
+        self.__connecting = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        '''Close all connections of the pool.'''
+        connections, self.__connections = self.__connections, []
+        for connection in connections:
+            await connection.close()
+
+    async def request(self, field, method, arguments=None, timeout=None):
+        '''Send a request and return the result of its reply.
+        Raise asyncio.TimeoutError, if there is no reply within the timeout,
+        and ConnectionError, if the connection is lost meanwhile.
+
+        Arguments:
+        field -- The field of the request
+        method -- The method of the request
+        arguments -- The arguments of the request
+        timeout -- The number of seconds to wait for the reply (the default
+                   timeout of the client, if None)
+        '''
+        message = {
+            'id': next(self.__message_ids),
+            'type': 'request',
+            'query': {
+                'field': field,
+                'method': method,
+                'arguments': arguments,
+                },
+            }
+
+        connection = await self.__get_connection()
+
+        return await connection.request(
+            message, self.__timeout if timeout is None else timeout)
+
+    async def __get_connection(self):
+        '''Get the connection with the fewest pending requests. A new
+        connection is opened, if all are busy and the pool is not full.'''
+        self.__connections = [connection for connection in self.__connections
+                              if not connection.is_closed()]
+
+        if len(self.__connections) < self.__pool_size and \
+                all(connection.get_load() for connection in self.__connections):
+            # Requests arriving while a connection is opened wait for it
+            # instead of opening further connections
+            if self.__connecting is None:
+                self.__connecting = asyncio.ensure_future(self.__connect())
+            connecting = self.__connecting
+            await asyncio.shield(connecting)
+
+        return min(self.__connections, key=lambda connection:
+                   connection.get_load())
+
+    async def __connect(self):
+        '''Open a new connection of the pool.'''
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(*self.__address), self.__timeout)
+            self.__connections.append(_Connection(reader, writer))
+        finally:
+            self.__connecting = None
+
+    # MODULE -------------------------------------------------------------------
+    async def reset(self):
+        '''Reset the model. Return True, if the request succeeded.'''
+        return await self.request('module', 'RESET')
+
+    # DESCRIPTION --------------------------------------------------------------
+    async def set_description(self, description):
+        '''Set the description of the model. Return True, if the request
+        succeeded.'''
+        return await self.request('description', 'SET', description)
+
+    async def get_description(self):
+        '''Get the description of the model as string.'''
+        return await self.request('description', 'GET')
+
+    # ACTIONS ------------------------------------------------------------------
+    async def add_actions(self, *actions):
+        '''Add actions to the model. Return True, if the request succeeded.'''
+        return await self.request('action', 'ADD', list(actions))
+
+    async def remove_actions(self, *actions):
+        '''Remove actions from the model. Return True, if the request
+        succeeded.'''
+        return await self.request('action', 'REMOVE', list(actions))
+
+    async def rename_action(self, action_old, action_new):
+        '''Rename an action. Return True, if the request succeeded.'''
+        return await self.request('action', 'RENAME',
+                                  {'old': action_old, 'new': action_new})
+
+    async def get_actions(self):
+        '''Get the actions of the model as list of strings.'''
+        return await self.request('action', 'GET')
+
+    # BACKGROUND ---------------------------------------------------------------
+    async def add_background(self, *background):
+        '''Add background conditions to the model. Return True, if the request
+        succeeded.'''
+        return await self.request('background', 'ADD', list(background))
+
+    async def remove_background(self, *background):
+        '''Remove background conditions from the model. Return True, if the
+        request succeeded.'''
+        return await self.request('background', 'REMOVE', list(background))
+
+    async def rename_background(self, bg_old, bg_new):
+        '''Rename a background condition. Return True, if the request
+        succeeded.'''
+        return await self.request('background', 'RENAME',
+                                  {'old': bg_old, 'new': bg_new})
+
+    async def get_background(self):
+        '''Get the background conditions of the model as list of strings.'''
+        return await self.request('background', 'GET')
+
+    # CONSEQUENCES -------------------------------------------------------------
+    async def add_consequences(self, *consequences):
+        '''Add consequences to the model. Return True, if the request
+        succeeded.'''
+        return await self.request('consequence', 'ADD', list(consequences))
+
+    async def remove_consequences(self, *consequences):
+        '''Remove consequences from the model. Return True, if the request
+        succeeded.'''
+        return await self.request('consequence', 'REMOVE', list(consequences))
+
+    async def rename_consequence(self, con_old, con_new):
+        '''Rename a consequence. Return True, if the request succeeded.'''
+        return await self.request('consequence', 'RENAME',
+                                  {'old': con_old, 'new': con_new})
+
+    async def get_consequences(self):
+        '''Get the consequences of the model as list of strings.'''
+        return await self.request('consequence', 'GET')
+
+    # MECHANISMS ---------------------------------------------------------------
+    async def add_mechanisms(self, consequence, *variables):
+        '''Add variables to the mechanism of a consequence. Return True, if the
+        request succeeded.'''
+        return await self.request('mechanism', 'ADD',
+                                  {'consequence': consequence,
+                                   'variables': list(variables)})
+
+    async def remove_mechanisms(self, consequence, *variables):
+        '''Remove variables from the mechanism of a consequence. Return True,
+        if the request succeeded.'''
+        return await self.request('mechanism', 'REMOVE',
+                                  {'consequence': consequence,
+                                   'variables': list(variables)})
+
+    async def get_mechanisms(self):
+        '''Get the mechanisms of the model as dictionary which maps every
+        consequence to a list of variables.'''
+        return await self.request('mechanism', 'GET')
+
+    # UTILITIES ----------------------------------------------------------------
+    async def set_utility(self, consequence, value, affirmation=True):
+        '''Set the utility of a consequence (or of not reaching it, if
+        affirmation is False). Return True, if the request succeeded.'''
+        return await self.request('utility', 'SET',
+                                  {'consequence': consequence, 'value': value,
+                                   'affirmation': affirmation})
+
+    async def remove_utility(self, consequence, affirmation=True):
+        '''Remove the utility of a consequence (or of not reaching it, if
+        affirmation is False). Return True, if the request succeeded.'''
+        return await self.request('utility', 'REMOVE',
+                                  {'consequence': consequence,
+                                   'affirmation': affirmation})
+
+    async def get_utilities(self):
+        '''Get the utilities of the model as dictionary which maps
+        consequences c and negated consequences Not('c') to integers.'''
+        return await self.request('utility', 'GET')
+
+    # INTENTIONS ---------------------------------------------------------------
+    async def add_intentions(self, action, *consequences):
+        '''Add consequences to the intention of an action. Return True, if the
+        request succeeded.'''
+        return await self.request('intention', 'ADD',
+                                  {'action': action,
+                                   'consequences': list(consequences)})
+
+    async def remove_intentions(self, action, *consequences):
+        '''Remove consequences from the intention of an action. Return True,
+        if the request succeeded.'''
+        return await self.request('intention', 'REMOVE',
+                                  {'action': action,
+                                   'consequences': list(consequences)})
+
+    async def get_intentions(self):
+        '''Get the intentions of the model as dictionary which maps every
+        action to a list of consequences.'''
+        return await self.request('intention', 'GET')
+
+    # STATISTICS ---------------------------------------------------------------
+    async def set_stats(self, enabled):
+        '''Enable or disable the instrumentation of the server. Return True, if
+        the request succeeded.'''
+        return await self.request('stats', 'SET', enabled)
+
+    async def reset_stats(self):
+        '''Remove the measurements of the server. Return True, if the request
+        succeeded.'''
+        return await self.request('stats', 'RESET')
+
+    async def get_stats(self):
+        '''Get the measurements of the server as dictionary which maps the
+        names of methods and stages to their records.'''
+        return await self.request('stats', 'GET')
+
+
+async def benchmark(server, requests=10000, concurrency=64, pool_size=4):
+    '''Send GET requests to a server and return a report with the elapsed
+    time, the throughput and the latency percentiles.
+
+    Arguments:
+    server -- The (host, port) tuple of the server
+    requests -- The total number of requests
+    concurrency -- The maximal number of requests in flight
+    pool_size -- The number of connections of the client
+    '''
+    latencies = []
+    window = asyncio.Semaphore(concurrency)
+
+    async with Client(*server, pool_size=pool_size) as client:
+        async def timed_request():
+            async with window:
+                start = time.perf_counter()
+                await client.get_actions()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.monotonic()
+        await asyncio.gather(*(timed_request() for _ in range(requests)))
+        elapsed = time.monotonic() - start
+
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'latencies': summarize(latencies),
+        }
+
+
+def main():
+    '''Parse the command line arguments and benchmark the client.'''
+    parser = argparse.ArgumentParser(description='Benchmark the hera client '
+                                     'against a running server.')
+    parser.add_argument('--server', type=parse_address,
+                        default=('localhost', 9000))
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='requests in flight')
+    parser.add_argument('--pool', type=int, default=4,
+                        help='number of connections')
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args.server, args.requests,
+                                   args.concurrency, args.pool))
+
+    print('{requests} requests in {seconds:.3f}s ({throughput:.1f}/s)'
+          .format(**report))
+    print('p50={p50:.6f}s p95={p95:.6f}s p99={p99:.6f}s'
+          .format(**report['latencies']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module records the request messages of real sessions and replays them
+against a hera server with many simulated robots.
+
+Record a session by connecting the furhat to a recording proxy in front of the
+server:
+    python3 loadtest.py record --port 9001 --upstream localhost:9000 \\
+        --output session.jsonl
+Replay it with 10 robots at twice the recorded speed:
+    python3 loadtest.py replay session.jsonl --server localhost:9000 \\
+        --robots 10 --speed 2
+'''
+import argparse
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+
+def parse_address(address):
+    '''Parse an address of the form host:port into a (host, port) tuple.'''
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+# RECORDING --------------------------------------------------------------------
+class _RecordingHandler(socketserver.StreamRequestHandler):
+    '''This class forwards the messages of one connection to the upstream
+    server and records the requests.'''
+    def handle(self):
+        '''Forward requests to the upstream server and replies back.'''
+        upstream = socket.create_connection(self.server.upstream)
+
+        def forward_replies():
+            for line in upstream.makefile('rb'):
+                self.wfile.write(line)
+
+        replies = threading.Thread(target=forward_replies, daemon=True)
+        replies.start()
+
+        try:
+            for line in self.rfile:
+                self.server.record(line)
+                upstream.sendall(line)
+        finally:
+            upstream.shutdown(socket.SHUT_WR)
+            replies.join()
+            upstream.close()
+
+
+class RecordingProxy(socketserver.ThreadingTCPServer):
+    '''This class represents a proxy which records all request messages sent
+    to a server as lines of the form
+        {"time": <SECONDS SINCE START>, "message": <MESSAGE>}
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, upstream, output_file):
+        '''Initialize the proxy.
+
+        Arguments:
+        address -- The (host, port) tuple the proxy listens on
+        upstream -- The (host, port) tuple of the server
+        output_file -- The file the requests are written to
+        '''
+        super().__init__(address, _RecordingHandler)
+        self.upstream = upstream
+        self.__output_file = output_file
+        self.__lock = threading.Lock()
+        self.__start = None
+
+    def record(self, line):
+        '''Record a request message received as line of json.'''
+        try:
+            message = json.loads(line.decode())
+        except ValueError:
+            return
+
+        with self.__lock:
+            now = time.monotonic()
+            if self.__start is None:
+                self.__start = now
+
+            self.__output_file.write(json.dumps({
+                'time': now - self.__start,
+                'message': message,
+                }) + '\n')
+            self.__output_file.flush()
+
+
+def load_session(filename):
+    '''Load a recorded session as a list of (time, message) tuples sorted by
+    time.
+    '''
+    session = []
+    with open(filename) as session_file:
+        for line in session_file:
+            if line.strip():
+                entry = json.loads(line)
+                session.append((entry['time'], entry['message']))
+
+    session.sort(key=lambda entry: entry[0])
+
+    return session
+
+
+# REPLAYING --------------------------------------------------------------------
+class _Robot(threading.Thread):
+    '''This class represents a simulated robot which replays a session on its
+    own connection.'''
+    def __init__(self, index, session, server, speed, concurrency, results):
+        '''Initialize the robot.
+
+        Arguments:
+        index -- The number of the robot
+        session -- The session as list of (time, message) tuples
+        server -- The (host, port) tuple of the server
+        speed -- The factor by which the session is sped up (0 replays the
+                 session as fast as possible)
+        concurrency -- The maximal number of requests waiting for a reply
+        results -- The list the (field, method, latency) tuples are added to
+        '''
+        super().__init__(daemon=True)
+        self.__index = index
+        self.__session = session
+        self.__server = server
+        self.__speed = speed
+        self.__window = threading.Semaphore(concurrency)
+        self.__results = results
+        self.__pending = {}
+        self.__lock = threading.Lock()
+
+    def run(self):
+        '''Replay the session.'''
+        with socket.create_connection(self.__server) as connection:
+            receiver = threading.Thread(target=self.__receive,
+                                        args=(connection,), daemon=True)
+            receiver.start()
+
+            start = time.monotonic()
+            for message_id, (offset, message) in enumerate(self.__session):
+                if self.__speed:
+                    delay = start + offset / self.__speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                self.__window.acquire()
+
+                # Replace the recorded id with one that is unique for the robot
+                # and let every robot be a client of its own
+                message = dict(message, id=message_id)
+                if 'client' in message:
+                    message['client'] = '{}-{}'.format(message['client'],
+                                                       self.__index)
+                query = message['query']
+                with self.__lock:
+                    self.__pending[message_id] = (query['field'],
+                                                  query['method'],
+                                                  time.perf_counter())
+
+                connection.sendall((json.dumps(message) + '\n').encode())
+
+            receiver.join()
+
+    def __receive(self, connection):
+        '''Receive the replies until all requests are answered.'''
+        remaining = len(self.__session)
+        replies = connection.makefile('rb')
+
+        while remaining:
+            line = replies.readline()
+            if not line:
+                print('Robot {}: connection closed with {} requests pending'
+                      .format(self.__index, remaining), file=sys.stderr)
+                return
+
+            received = time.perf_counter()
+            reply_to = json.loads(line.decode())['query']['reply_to']
+            with self.__lock:
+                field, method, sent = self.__pending.pop(reply_to)
+
+            self.__results.append((field, method, received - sent))
+            self.__window.release()
+            remaining -= 1
+
+
+def replay(session, server, robots=1, speed=1.0, concurrency=1):
+    '''Replay a session with simulated robots and return a report.
+    The report contains the total number of requests, the elapsed time, the
+    throughput and the latency percentiles per field and method.
+
+    Arguments:
+    session -- The session as list of (time, message) tuples
+    server -- The (host, port) tuple of the server
+    robots -- The number of simulated robots
+    speed -- The factor by which the session is sped up (0 replays the session
+             as fast as possible)
+    concurrency -- The maximal number of requests every robot waits for
+    '''
+    results = []
+    threads = [_Robot(index, session, server, speed, concurrency, results)
+               for index in range(robots)]
+
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    latencies = {}
+    for field, method, latency in results:
+        latencies.setdefault('{} {}'.format(field, method), []).append(latency)
+
+    return {
+        'requests': len(results),
+        'seconds': elapsed,
+        'throughput': len(results) / elapsed if elapsed else 0.0,
+        'latencies': {pair: summarize(values)
+                      for pair, values in sorted(latencies.items())},
+        }
+
+
+def summarize(latencies):
+    '''Return the number and the 50th, 95th and 99th percentile of a list of
+    latencies in seconds.
+    '''
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        # Nearest-rank percentile
+        rank = max(1, -(-len(latencies) * fraction // 1))
+        return latencies[int(rank) - 1]
+
+    return {
+        'count': len(latencies),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        }
+
+
+def main():
+    '''Parse the command line arguments and record or replay a session.'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    record_parser = commands.add_parser('record')
+    record_parser.add_argument('--host', default='0.0.0.0')
+    record_parser.add_argument('--port', type=int, default=9001)
+    record_parser.add_argument('--upstream', type=parse_address,
+                               default=('localhost', 9000))
+    record_parser.add_argument('--output', required=True)
+
+    replay_parser = commands.add_parser('replay')
+    replay_parser.add_argument('session')
+    replay_parser.add_argument('--server', type=parse_address,
+                               default=('localhost', 9000))
+    replay_parser.add_argument('--robots', type=int, default=1)
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                               help='speed-up factor, 0 for no delays')
+    replay_parser.add_argument('--concurrency', type=int, default=1,
+                               help='requests in flight per robot')
+    replay_parser.add_argument('--output', help='save the report as json')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        with open(args.output, 'a') as output_file:
+            with RecordingProxy((args.host, args.port), args.upstream,
+                                output_file) as proxy:
+                proxy.serve_forever()
+    else:
+        report = replay(load_session(args.session), args.server, args.robots,
+                        args.speed, args.concurrency)
+
+        print('{requests} requests in {seconds:.3f}s ({throughput:.1f}/s)'
+              .format(**report))
+        for pair, summary in report['latencies'].items():
+            print('{:<24} n={count:<7} p50={p50:.6f}s p95={p95:.6f}s '
+                  'p99={p99:.6f}s'.format(pair, **summary))
+
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(report, output_file, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module provides the locks which make models safe to use from multiple
+threads.'''
+import threading
+
+
+class _LockContext:
+    '''This class represents a context manager which acquires a lock on entry
+    and releases it on exit.'''
+    def __init__(self, acquire, release):
+        '''Initialize the context with the acquire and release functions.'''
+        self.__acquire = acquire
+        self.__release = release
+
+    def __enter__(self):
+        self.__acquire()
+
+    def __exit__(self, *exc_info):
+        self.__release()
+
+
+class RWLock:
+    '''This class represents a reader/writer lock. Any number of readers may
+    hold the lock at the same time, while a writer holds it exclusively.
+    Waiting writers are preferred over new readers, so that writers do not
+    starve.
+
+    Both kinds of locking are reentrant and a writer may also read. A reader
+    must not try to become a writer, since this would deadlock.
+
+    Use the lock with
+        with lock.reading:
+            ...
+        with lock.writing:
+            ...
+    '''
+    def __init__(self):
+        '''Initialize the lock.'''
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__waiting_writers = 0
+        self.__writer = None
+        self.__write_depth = 0
+        self.__local = threading.local()
+
+        self.reading = _LockContext(self.acquire_read, self.release_read)
+        self.writing = _LockContext(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        '''Acquire the lock for reading.'''
+        depth = getattr(self.__local, 'depth', 0)
+
+        # Only the outermost read of a thread which is not the writer counts
+        if depth == 0:
+            self.__local.counted = self.__writer != threading.get_ident()
+
+            if self.__local.counted:
+                with self.__condition:
+                    while self.__writer is not None or self.__waiting_writers:
+                        self.__condition.wait()
+                    self.__readers += 1
+
+        self.__local.depth = depth + 1
+
+    def release_read(self):
+        '''Release the lock acquired for reading.'''
+        self.__local.depth -= 1
+
+        if self.__local.depth == 0 and self.__local.counted:
+            with self.__condition:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__condition.notify_all()
+
+    def acquire_write(self):
+        '''Acquire the lock for writing.'''
+        me = threading.get_ident()
+
+        if self.__writer == me:
+            self.__write_depth += 1
+            return
+
+        if getattr(self.__local, 'depth', 0):
+            raise RuntimeError('A reader cannot acquire the lock for writing.')
+
+        with self.__condition:
+            self.__waiting_writers += 1
+            while self.__readers or self.__writer is not None:
+                self.__condition.wait()
+            self.__waiting_writers -= 1
+
+            self.__writer = me
+            self.__write_depth = 1
+
+    def release_write(self):
+        '''Release the lock acquired for writing.'''
+        self.__write_depth -= 1
+
+        if not self.__write_depth:
+            with self.__condition:
+                self.__writer = None
+                self.__condition.notify_all()
+
+
+class _NoLockContext:
+    '''This class represents a context manager which does nothing.'''
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NoLock:
+    '''This class represents a lock with the interface of RWLock which does not
+    lock at all. It is used by models which are not shared between threads.'''
+    reading = _NoLockContext()
+    writing = _NoLockContext()
@@ -2,22 +2,102 @@
 #          Windy Phung <phungw@informatik.uni-freiburg.de>
 # Copyright 2019
 '''This module provides the functionality to build hera models.'''
+import functools
+import hashlib
 import json
-import os
-from ethics.semantics import CausalModel
+import math
+import random
+import statistics
 
+import backends
+from locking import NoLock, RWLock
+import stats
+
+def _reading(method):
+    '''Decorate a method of a model to hold the read lock of the model.'''
+    @functools.wraps(method)
+    def wrapper(model, *args, **kwargs):
+        with model._Model__lock.reading:
+            return method(model, *args, **kwargs)
+
+    return wrapper
+
+def _writing(method):
+    '''Decorate a method of a model to hold the write lock of the model.'''
+    @functools.wraps(method)
+    def wrapper(model, *args, **kwargs):
+        with model._Model__lock.writing:
+            return method(model, *args, **kwargs)
+
+    return wrapper
+
+@stats.instrument
 class Model:
     '''This class represents a Utility-based Causal Agency Models.'''
-    def __init__(self, description):
-        '''Initialize the model with a description.'''
+    __FINGERPRINT_BYTES = 16
+    __FINGERPRINT_MODULUS = 2 ** (8 * __FINGERPRINT_BYTES)
+
+    # Positions of the utilities of reaching and of not reaching a consequence
+    # in its pair of utilities
+    __AFFIRMATION = 0
+    __NEGATION = 1
+
+    def __init__(self, description, thread_safe=False):
+        '''Initialize the model with a description.
+
+        Arguments:
+        description -- A string that describes the model
+        thread_safe -- True, if the model is shared between threads. Then any
+                       number of threads may read the model at the same time,
+                       while changes are made by one thread at a time.
+        '''
         self.__description = description
+        self.__lock = RWLock() if thread_safe else NoLock()
         self.__actions = []
         self.__background = []
         self.__consequences = []
         self.__mechanisms = {}
-        self.__utilities = {}
         self.__intentions = {}
 
+        # Every consequence with a utility maps to the pair of the utilities
+        # of reaching and of not reaching it (None, if not set). The keys of
+        # the form Not('c') are only built for serialization.
+        self.__utilities = {}
+
+        # Cache of the actions and background conditions every consequence
+        # transitively depends on. It is built lazily and dropped whenever a
+        # mechanism changes.
+        self.__supports = None
+
+        # Dependency graph of the consequences: every consequence maps to the
+        # consequences whose mechanism contains it. The ranks give a
+        # topological order of the consequences (with gaps) in which every
+        # consequence comes after the consequences it depends on. Both are
+        # built lazily and maintained on every mutation afterwards.
+        self.__dependents = None
+        self.__ranks = None
+        self.__next_rank = 0
+        self.__order = None
+
+        # Issues of the model reported by check(), kept as sets per kind of
+        # issue, and the number of mechanisms every action and background
+        # condition occurs in. Both are built lazily on the first check and
+        # maintained on every mutation afterwards.
+        self.__issues = None
+        self.__usage = None
+
+        # Index of the intentions: every intended consequence maps to the
+        # actions intending it, which are the keys of a dictionary. It is built
+        # lazily and maintained on every mutation afterwards.
+        self.__intenders = None
+
+        # Fingerprint of the content of the model (everything except the
+        # description). It is the sum of stable hashes of all parts of the
+        # model and therefore independent of their order and of the process.
+        # It is computed lazily and updated on every mutation afterwards.
+        self.__fingerprint = None
+
+    @_reading
     def __repr__(self):
         '''Return a json-formatted string which represents the model.'''
         mechanisms = {}
@@ -34,12 +114,36 @@ class Model:
             'consequences': self.__consequences,
 
             'mechanisms': mechanisms,
-            'utilities': self.__utilities,
+            'utilities': self.__serialize_utilities(),
             'intentions': self.__intentions,
             }
 
         return json.dumps(model_dict, indent=4, sort_keys=True)
 
+    def __eq__(self, other):
+        '''Return True, if another model has the same content.
+        The descriptions of the models are not compared.
+        '''
+        if not isinstance(other, Model):
+            return NotImplemented
+
+        # Models with different fingerprints differ, equal fingerprints are
+        # confirmed by comparing the content. Each model is read under its own
+        # lock, one after another, so that the locks of both models are never
+        # held at the same time.
+        if self.get_fingerprint() != other.get_fingerprint():
+            return False
+
+        return self.__canonical_content() == other.__canonical_content()
+
+    def __hash__(self):
+        '''Return a hash of the content of the model.
+        Models must not be changed while they are used in sets or as keys of
+        dictionaries.
+        '''
+        return hash(self.get_fingerprint())
+
+    @_writing
     def reset(self):
         '''Reset the model.
         Clear all lists and dictionaries, only the description stays unchanged.
@@ -49,53 +153,124 @@ class Model:
             if isinstance(attr, list) or isinstance(attr, dict):
                 attr.clear()
 
+        self.__mechanisms_changed()
+        self.__dependents = None
+        self.__ranks = None
+        self.__order = None
+        self.__issues = None
+        self.__usage = None
+        self.__intenders = None
+        self.__fingerprint = None
+
+    @_reading
     def check(self):
-        '''Checks if all consequences can be reached (mechanism exists).'''
-        for consequence in self.__consequences:
-            if self.__mechanisms[consequence] == []:
-                raise RuntimeError('Consequence {} cannot be reached since '
-                                   .format(consequence)
-                                   + 'there is no mechanism for it.')
+        '''Check the model and return a report of all issues found.
+        The report is a dictionary with the following entries:
+
+        cyclic_mechanisms -- Consequences whose mechanisms depend on
+                             themselves
+        dangling_intentions -- A dictionary which maps actions to the intended
+                               consequences that are not in the model
+        empty_mechanisms -- Consequences which cannot be reached since there
+                            is no mechanism for them
+        missing_utilities -- Consequences without any utility
+        unused_actions -- Actions which occur in no mechanism
+        unused_background -- Background conditions which occur in no mechanism
+        '''
+        issues = self.__get_issues()
+
+        try:
+            self.__get_ranks()
+            cyclic = []
+        except RuntimeError:
+            order = self.__sort_consequences()[1]
+            cyclic = sorted(set(self.__consequences) - set(order))
+
+        dangling = {}
+        for action, consequence in issues['dangling_intentions']:
+            dangling.setdefault(action, []).append(consequence)
+
+        return {
+            'cyclic_mechanisms': cyclic,
+            'dangling_intentions': {action: sorted(consequences)
+                                    for action, consequences
+                                    in dangling.items()},
+            'empty_mechanisms': sorted(issues['empty_mechanisms']),
+            'missing_utilities': sorted(issues['missing_utilities']),
+            'unused_actions': sorted(issues['unused_actions']),
+            'unused_background': sorted(issues['unused_background']),
+            }
+
+    @_reading
+    def get_topological_order(self):
+        '''Get the consequences of the model in an order, in which every
+        consequence comes after all consequences its mechanism depends on.
+        '''
+        return list(self.__get_order())
 
-    def export(self, assignment):
-        '''Export the model as a CausalModel from the ethics module.
+    @_reading
+    def export(self, assignment, cache=None, backend=None):
+        '''Export the model as a CausalModel from the ethics module (or to
+        another backend).
 
         Arguments:
         assignment -- A dictionary that assigns each action and background
                       condition a truth value
+        cache -- An optional LRUCache in which exported models are looked up
+                 and stored
+        backend -- The name of the backend (see backends.py) or a backend (the
+                   default backend, if None)
         '''
-        # Check, if the assignment is valid
-        if set(assignment.keys()) < set(self.__actions + self.__background):
-            raise KeyError('The following variables have no assignment: {}'
-                           .format(set(self.__actions + self.__background) -
-                                   set(assignment.keys())))
-
-        if set(assignment.keys()) != set(self.__actions + self.__background):
-            raise KeyError('The assignment contains variables which are not in '
-                           + 'the model: {}'
-                           .format(set(assignment.keys()) -
-                                   set(self.__actions + self.__background)))
-
-        if not set(assignment.values()) <= {0, 1}:
-            raise ValueError('Assignments must assign either 0 or 1 to a '
-                             + 'variable. {} are no valid assignment values.'
-                             .format(set(assignment.values()) - {0, 1}))
+        self.__verify_assignment(assignment)
+        backend = backends.get_backend(backend)
 
-        filename = 'tmp_model.json'
+        if cache is not None:
+            key = ('export', backend.name, self.get_fingerprint(),
+                   self.__description, frozenset(assignment.items()))
+            hera_model = cache.get(key)
+            if hera_model is not None:
+                return hera_model
 
-        # Export model to temporary json file
-        with open(filename, 'w') as tmp_file:
-            tmp_file.write(repr(self))
+        hera_model = backend.export(self, assignment)
 
-        # Initialize a CausalModel with the json file
-        hera_model = CausalModel(filename, assignment)
-
-        # Remove the temporary file
-        os.remove(filename)
+        if cache is not None:
+            cache.put(key, hera_model)
 
         return hera_model
 
+    @_reading
+    def get_fingerprint(self):
+        '''Get a fingerprint of the content of the model.
+        Models with the same actions, background conditions, consequences,
+        mechanisms, utilities and intentions have the same fingerprint,
+        regardless of the order in which they were added and of the process in
+        which they were built.
+        '''
+        if self.__fingerprint is None:
+            parts = ([('action', action) for action in self.__actions]
+                     + [('background', bg_condition)
+                        for bg_condition in self.__background]
+                     + [('consequence', consequence)
+                        for consequence in self.__consequences]
+                     + [('mechanism', consequence, variable)
+                        for consequence, mechanism in self.__mechanisms.items()
+                        for variable in mechanism]
+                     + [('utility', key, value)
+                        for key, value
+                        in self.__serialize_utilities().items()]
+                     + [('intention', action, consequence)
+                        for action, intended in self.__intentions.items()
+                        for consequence in intended])
+
+            # Readers of a shared model may compute the fingerprint at the same
+            # time, so it is only assigned when complete
+            self.__fingerprint = (sum(self.__hash_part(part) for part in parts)
+                                  % self.__FINGERPRINT_MODULUS)
+
+        return self.__fingerprint
+
     # DESCRIPTION --------------------------------------------------------------
+    @_writing
     def set_description(self, description):
         '''Set the description of the model.
 
@@ -106,11 +281,13 @@ class Model:
 
         self.__description = description
 
+    @_reading
     def get_description(self):
         '''Get the description of the model.'''
         return self.__description
 
     # ACTIONS ------------------------------------------------------------------
+    @_writing
     def add_actions(self, *actions):
         '''Add one or more actions to the model.
         If the action is already in the list, it will not be added twice.
@@ -129,6 +306,11 @@ class Model:
                 # itself
                 self.__intentions[action] = [action]
 
+                self.__register_usage('unused_actions', action)
+                self.__hash_content(1, 'action', action)
+                self.__hash_content(1, 'intention', action, action)
+
+    @_writing
     def remove_actions(self, *actions):
         '''Remove one or more actions from list of actions.
         If there is no such action in the list, this will be ignored.
@@ -147,11 +329,18 @@ class Model:
                 self.__actions.remove(action)
 
                 # Remove the intentions of the action from the model.
+                self.__hash_list(-1, 'intention', action,
+                                 self.__intentions[action])
+                for consequence in self.__intentions[action]:
+                    self.__index_intention(action, consequence, False)
                 del self.__intentions[action]
+                self.__forget_issues(action)
+                self.__hash_content(-1, 'action', action)
 
                 # Remove the action from all mechanisms (if it occurs)
-                self.__remove_item_from_list_dict(action, self.__mechanisms)
+                self.__remove_from_mechanisms(action)
 
+    @_writing
     def rename_action(self, action_old, action_new):
         '''Renames action and changes the action name accordingly in
         mechanism and intentions containing that action.
@@ -170,20 +359,29 @@ class Model:
                              + ' must be new.')
 
         self.__rename_item_in_list(action_old, action_new, self.__actions)
+        self.__rename_issues(action_old, action_new)
+        self.__hash_content(-1, 'action', action_old)
+        self.__hash_content(1, 'action', action_new)
 
         # Rename action within mechanisms
         self.__rename_item_in_list_dict(action_old, action_new,
-                                        self.__mechanisms)
+                                        self.__mechanisms, 'mechanism')
+        self.__mechanisms_changed()
 
         # Rename action within intentions
         self.__rename_item_in_list_dict(action_old, action_new,
-                                        self.__intentions, True)
+                                        self.__intentions, 'intention', True)
+        for consequence in self.__intentions[action_new]:
+            self.__index_intention(action_old, consequence, False)
+            self.__index_intention(action_new, consequence)
 
+    @_reading
     def get_actions(self):
-        '''Get the actions of the model.'''
-        return self.__actions
+        '''Get a copy of the actions of the model.'''
+        return list(self.__actions)
 
     # BACKGROUND ---------------------------------------------------------------
+    @_writing
     def add_background(self, *background):
         '''Add one or more background conditions to the model.
         If the background condition is already in the list, it will not be added
@@ -198,8 +396,12 @@ class Model:
             self.__verify_background(bg_condition)
 
             # Add the background condition to the background list
-            self.__append_if_new(bg_condition, self.__background)
+            if bg_condition not in self.__background:
+                self.__background.append(bg_condition)
+                self.__register_usage('unused_background', bg_condition)
+                self.__hash_content(1, 'background', bg_condition)
 
+    @_writing
     def remove_background(self, *background):
         '''Remove one or more background conditions from the model.
         If there is no such background condition in the model, this will be
@@ -216,11 +418,13 @@ class Model:
             # If the condition exists, remove it from the model.
             if bg_condition in self.__background:
                 self.__background.remove(bg_condition)
+                self.__forget_issues(bg_condition)
+                self.__hash_content(-1, 'background', bg_condition)
 
                 # Update mechanisms which contain the background
-                self.__remove_item_from_list_dict(bg_condition,
-                                                  self.__mechanisms)
+                self.__remove_from_mechanisms(bg_condition)
 
+    @_writing
     def rename_background(self, bg_old, bg_new):
         '''Renames background and changes the background name accordingly in
         mechanism containing that background.
@@ -236,14 +440,25 @@ class Model:
 
         if bg_new not in self.__background:
             self.__rename_item_in_list(bg_old, bg_new, self.__background)
+            self.__rename_issues(bg_old, bg_new)
+            self.__hash_content(-1, 'background', bg_old)
+            self.__hash_content(1, 'background', bg_new)
 
             # Rename background within mechanisms
-            self.__rename_item_in_list_dict(bg_old, bg_new, self.__mechanisms)
+            self.__rename_item_in_list_dict(bg_old, bg_new, self.__mechanisms,
+                                            'mechanism')
+            self.__mechanisms_changed()
         else:
             raise ValueError('New background name already exists. Replacing'+ 
             ' background must be new.') 
 
+    @_reading
+    def get_background(self):
+        '''Get a copy of the background conditions of the model.'''
+        return list(self.__background)
+
     # CONSEQUENCES -------------------------------------------------------------
+    @_writing
     def add_consequences(self, *consequences):
         '''Add one or more consequences to the model.
         If the consequence is already in the list, it will not be added twice.
@@ -256,10 +471,22 @@ class Model:
             self.__verify_consequence(consequence)
 
             # If it does not already exists, add the consequence to the list
-            self.__append_if_new(consequence, self.__consequences)
-
-            self.__mechanisms[consequence] = []
-
+            # and instantiate its mechanism
+            if consequence not in self.__consequences:
+                self.__consequences.append(consequence)
+                self.__mechanisms[consequence] = []
+                self.__graph_add_consequence(consequence)
+
+                self.__track_issue('empty_mechanisms', consequence)
+                self.__track_issue('missing_utilities', consequence)
+                self.__resolve_dangling_intentions(consequence)
+                self.__hash_content(1, 'consequence', consequence)
+
+                # Drop the cache with every change, since a later argument
+                # may still be rejected
+                self.__mechanisms_changed()
+
+    @_writing
     def remove_consequences(self, *consequences):
         '''Remove one or multiple consequences from the model.
         This also removes the mechanisms and utilites of the consequences.
@@ -276,20 +503,33 @@ class Model:
             # If the consequence exists, remove it from the model.
             if consequence in self.__consequences:
                 self.__consequences.remove(consequence)
+                self.__graph_remove_consequence(consequence)
+                self.__forget_issues(consequence)
+                self.__hash_content(-1, 'consequence', consequence)
 
                 # If consequence is part of a mechanism, delete mechanism.
                 if consequence in self.__mechanisms:
+                    for variable in self.__mechanisms[consequence]:
+                        self.__count_usage(variable, -1)
+                    self.__hash_list(-1, 'mechanism', consequence,
+                                     self.__mechanisms[consequence])
                     del self.__mechanisms[consequence]
 
+                # Remove the consequence from all mechanisms (if it occurs)
+                self.__remove_from_mechanisms(consequence)
+
                 # Remove the utilities of the consequence from the model
-                for cons_string in [consequence, self.__not_str(consequence)]:
-                    if cons_string in self.__utilities:
-                        del self.__utilities[cons_string]
+                if consequence in self.__utilities:
+                    self.__hash_utilities(-1, consequence,
+                                          self.__utilities.pop(consequence))
 
-                # Remove the consequence from all intentions
-                self.__remove_item_from_list_dict(consequence,
-                                                  self.__intentions)
+                # Remove the consequence from the intentions of the actions
+                # intending it
+                for action in self.__get_intenders().pop(consequence, {}):
+                    self.__intentions[action].remove(consequence)
+                    self.__hash_content(-1, 'intention', action, consequence)
 
+    @_writing
     def rename_consequence(self, con_old, con_new):
         '''Renames consequence and changes the consequence name accordingly in
         mechanisms, utilities and intentions containing that consequence.
@@ -305,26 +545,49 @@ class Model:
 
         if con_new not in self.__consequences:
             self.__rename_item_in_list(con_old, con_new, self.__consequences)
+            self.__graph_rename_consequence(con_old, con_new)
+            self.__rename_issues(con_old, con_new)
+            self.__resolve_dangling_intentions(con_new)
+            self.__hash_content(-1, 'consequence', con_old)
+            self.__hash_content(1, 'consequence', con_new)
 
             # Rename consequence within mechanisms
             self.__rename_item_in_list_dict(con_old, con_new, self.__mechanisms,
-                                            True)
+                                            'mechanism', True)
+            self.__mechanisms_changed()
 
             # Rename consequence within utilities
-            self.__rename_key(con_old, con_new, self.__utilities)
-            self.__rename_key(self.__not_str(con_old), self.__not_str(con_new),
-                            self.__utilities)
-
-            # Rename consequence within intentions
-            self.__rename_item_in_list_dict(con_old, con_new, self.__intentions)
+            if con_old in self.__utilities:
+                self.__hash_utilities(-1, con_old, self.__utilities[con_old])
+                self.__hash_utilities(1, con_new, self.__utilities[con_old])
+                self.__rename_key(con_old, con_new, self.__utilities)
+
+            # Rename consequence within the intentions of the actions intending
+            # it
+            intenders = self.__get_intenders()
+            actions = intenders.pop(con_old, {})
+            for action in actions:
+                self.__rename_item_in_list(con_old, con_new,
+                                           self.__intentions[action])
+                self.__hash_content(-1, 'intention', action, con_old)
+                self.__hash_content(1, 'intention', action, con_new)
+            if actions:
+                intenders.setdefault(con_new, {}).update(actions)
         else:
             raise ValueError('New consequence name already exists. Replacing'+ 
             ' consequence must be new.') 
 
+    @_reading
+    def get_consequences(self):
+        '''Get a copy of the consequences of the model.'''
+        return list(self.__consequences)
+
     # MECHANISMS ---------------------------------------------------------------
+    @_writing
     def add_mechanisms(self, consequence, *variables):
         '''Add one or more variables to the mechanism of a consequence.
         If the variable is already in the list, it will not be added twice.
+        A variable which would make the mechanism cyclic is rejected.
 
         Arguments:
         consequence -- The consequence for which the mechanism should be added.
@@ -332,13 +595,30 @@ class Model:
         '''
         self.__verify_consequence(consequence, True)
 
+        # Check all variables first, so that a rejected call leaves the
+        # mechanism unchanged. All new dependencies are dependencies of the
+        # same consequence, so none of them can make another one cyclic.
         for variable in variables:
             # Assure that the variable is valid (exist in the model)
             self.__verify_variable(variable, True)
+            self.__graph_check_dependency(consequence, variable)
 
+        for variable in variables:
             # If it does not already exists, add the variable to the list
-            self.__append_if_new(variable, self.__mechanisms[consequence])
+            mechanism = self.__mechanisms.setdefault(consequence, [])
+            if variable not in mechanism:
+                self.__graph_add_dependency(consequence, variable)
+                mechanism.append(variable)
 
+                self.__count_usage(variable, 1)
+                self.__hash_content(1, 'mechanism', consequence, variable)
+                self.__track_issue('empty_mechanisms', consequence, False)
+
+                # Drop the cache with every change, since a later argument
+                # may still be rejected
+                self.__mechanisms_changed()
+
+    @_writing
     def remove_mechanisms(self, consequence, *mechanism):
         '''Remove one or more intended variables of the mechanism of a
         consequence.
@@ -354,8 +634,24 @@ class Model:
             if variable in self.__mechanisms[consequence]:
                 # TODO: del self.__mechanisms[consequence] ?
                 self.__mechanisms[consequence].remove(variable)
+                self.__graph_remove_dependency(consequence, variable)
+
+                self.__count_usage(variable, -1)
+                self.__hash_content(-1, 'mechanism', consequence, variable)
+                self.__track_issue('empty_mechanisms', consequence,
+                                   not self.__mechanisms[consequence])
+                self.__mechanisms_changed()
+
+    @_reading
+    def get_mechanisms(self):
+        '''Get a copy of the mechanisms of the model as a dictionary which maps
+        every consequence to the list of variables of its mechanism.
+        '''
+        return {consequence: list(mechanism)
+                for consequence, mechanism in self.__mechanisms.items()}
 
     # UTLILITIES ---------------------------------------------------------------
+    @_writing
     def set_utility(self, consequence, value, affirmation=True):
         '''Set the utility of an consequence.
 
@@ -371,13 +667,17 @@ class Model:
         self.__verify_utility(value)
         self.__verify_consequence(consequence, True)
 
-        # Adjust the consequence name if the utility of not reaching the
-        # consequence is to be set
-        if not affirmation:
-            consequence = self.__not_str(consequence)
+        position = self.__AFFIRMATION if affirmation else self.__NEGATION
+        pair = self.__utilities.setdefault(consequence, [None, None])
+
+        if pair[position] is not None:
+            self.__hash_utility(-1, consequence, position, pair[position])
 
-        self.__utilities[consequence] = value
+        pair[position] = value
+        self.__track_issue('missing_utilities', consequence, False)
+        self.__hash_utility(1, consequence, position, value)
 
+    @_writing
     def remove_utility(self, consequence, affirmation=True):
         '''Remove the utility of a consequence.
         If there is no such consequence, the method does nothing.
@@ -392,14 +692,54 @@ class Model:
         # Typecheck consequence
         self.__verify_consequence(consequence)
 
-        if not affirmation:
-            consequence = self.__not_str(consequence)
+        position = self.__AFFIRMATION if affirmation else self.__NEGATION
+        pair = self.__utilities.get(consequence)
 
         # Remove the utility of the consequence, if it exists
-        if consequence in self.__utilities:
-            del self.__utilities[consequence]
+        if pair is not None and pair[position] is not None:
+            self.__hash_utility(-1, consequence, position, pair[position])
+            pair[position] = None
+
+            if pair == [None, None]:
+                del self.__utilities[consequence]
+                self.__track_issue('missing_utilities', consequence)
+
+    @_reading
+    def get_utilities(self):
+        '''Get a copy of the utilities of the model as a dictionary which maps
+        consequences c and negated consequences Not('c') to their utilities.
+        '''
+        return self.__serialize_utilities()
+
+    @_reading
+    def get_utility_pairs(self):
+        '''Get a copy of the utilities of the model as a dictionary which maps
+        every consequence with a utility to the pair of the utilities of
+        reaching and of not reaching it. Utilities which are not set are None.
+        '''
+        return {consequence: tuple(pair)
+                for consequence, pair in self.__utilities.items()}
+
+    @_reading
+    def get_utility_vectors(self, default=0):
+        '''Get the utilities of reaching and of not reaching the consequences
+        as two lists in the order of the consequences of the model, e.g. to
+        aggregate the utilities of an evaluation.
+
+        Arguments:
+        default -- The value of utilities which are not set
+        '''
+        missing = (default, default)
+        pairs = [self.__utilities.get(consequence, missing)
+                 for consequence in self.__consequences]
+
+        return ([default if pair[self.__AFFIRMATION] is None
+                 else pair[self.__AFFIRMATION] for pair in pairs],
+                [default if pair[self.__NEGATION] is None
+                 else pair[self.__NEGATION] for pair in pairs])
 
     # INTENTIONS ---------------------------------------------------------------
+    @_writing
     def add_intentions(self, action, *consequences):
         '''Add one or more consequences to the intention of an action.
         If the consequence is already in the list, it will not be added twice.
@@ -414,8 +754,12 @@ class Model:
 
             # If the consequence is not already in the intention of the action,
             # add it
-            self.__append_if_new(consequence, self.__intentions[action])
+            if consequence not in self.__intentions[action]:
+                self.__intentions[action].append(consequence)
+                self.__index_intention(action, consequence)
+                self.__hash_content(1, 'intention', action, consequence)
 
+    @_writing
     def remove_intentions(self, action, *consequences):
         '''Remove one or more consequences of an action.
         It is not possible, to remove the action itself from the intentions of
@@ -432,6 +776,362 @@ class Model:
 
             if consequence in self.__intentions[action]:
                 self.__intentions[action].remove(consequence)
+                self.__index_intention(action, consequence, False)
+                self.__hash_content(-1, 'intention', action, consequence)
+
+    @_reading
+    def get_intentions(self):
+        '''Get a copy of the intentions of the model as a dictionary which maps
+        every action to the list of its intended consequences.
+        '''
+        return {action: list(intended)
+                for action, intended in self.__intentions.items()}
+
+    @_reading
+    def intends(self, action, consequence):
+        '''Return True, if an action intends a consequence.
+
+        Arguments:
+        action -- The action
+        consequence -- The consequence
+        '''
+        self.__verify_action(action)
+        self.__verify_consequence(consequence)
+
+        return action in self.__get_intenders().get(consequence, ())
+
+    @_reading
+    def get_intending_actions(self, consequence):
+        '''Get the list of the actions which intend a consequence, in the order
+        in which the intentions were added. Consequences which are not in the
+        model are intended by no action.
+
+        Arguments:
+        consequence -- The intended consequence
+        '''
+        self.__verify_consequence(consequence)
+
+        return list(self.__get_intenders().get(consequence, ()))
+
+    @_reading
+    def get_intenders(self, consequences=None):
+        '''Get a dictionary which maps consequences to the lists of the actions
+        intending them, e.g. to check many consequences at once.
+
+        Arguments:
+        consequences -- The intended consequences (all consequences intended by
+                        any action, if None)
+        '''
+        intenders = self.__get_intenders()
+
+        if consequences is None:
+            return {consequence: list(actions)
+                    for consequence, actions in intenders.items()}
+
+        for consequence in consequences:
+            self.__verify_consequence(consequence)
+
+        return {consequence: list(intenders.get(consequence, ()))
+                for consequence in consequences}
+
+    # CAUSALITY ----------------------------------------------------------------
+    @_reading
+    def evaluate(self, assignment, cache=None):
+        '''Evaluate the consequences of the model for an assignment.
+        Return a dictionary which maps every consequence to 1, if it holds
+        under the assignment, and to 0 otherwise.
+
+        Arguments:
+        assignment -- A dictionary that assigns each action and background
+                      condition a truth value
+        cache -- An optional LRUCache in which evaluations are looked up and
+                 stored
+        '''
+        self.__verify_assignment(assignment)
+
+        if cache is not None:
+            key = ('evaluate', self.get_fingerprint(),
+                   frozenset(assignment.items()))
+            values = cache.get(key)
+            if values is not None:
+                return dict(values)
+
+        supports = self.__get_supports()
+
+        values = {consequence: self.__holds(supports[consequence], assignment)
+                  for consequence in self.__consequences}
+
+        if cache is not None:
+            cache.put(key, dict(values))
+
+        return values
+
+    @_reading
+    def get_but_for_causes(self, consequence, assignment):
+        '''Get the actions and background conditions which are but-for causes
+        of a consequence under an assignment, i.e. the variables whose value
+        change alone would change whether the consequence holds.
+
+        Arguments:
+        consequence -- The consequence in question
+        assignment -- A dictionary that assigns each action and background
+                      condition a truth value
+        '''
+        self.__verify_consequence(consequence, True)
+        self.__verify_assignment(assignment)
+
+        support = self.__get_supports()[consequence]
+
+        # A consequence without a mechanism cannot be changed by any variable
+        if support is None:
+            return []
+
+        # Since mechanisms are conjunctions, every variable of the support of a
+        # consequence that holds is a cause of it. A consequence that does not
+        # hold can only be brought about by a single variable, if it is the
+        # only unsatisfied part of the support.
+        unsatisfied = [var for var in support if not assignment[var]]
+        if not unsatisfied:
+            return sorted(support)
+        if len(unsatisfied) == 1:
+            return unsatisfied
+
+        return []
+
+    @_reading
+    def get_sufficient_sets(self, consequence, assignment):
+        '''Get the minimal sets of actions and background conditions which,
+        with their values from the assignment, are sufficient for a consequence
+        to hold. Since mechanisms are conjunctions, there is at most one such
+        set, which is returned as a list of sorted variable lists.
+
+        Arguments:
+        consequence -- The consequence in question
+        assignment -- A dictionary that assigns each action and background
+                      condition a truth value
+        '''
+        self.__verify_consequence(consequence, True)
+        self.__verify_assignment(assignment)
+
+        support = self.__get_supports()[consequence]
+
+        if not self.__holds(support, assignment):
+            return []
+
+        return [sorted(support)]
+
+    @_reading
+    def estimate(self, probabilities=None, actions=None, batch_size=1024,
+                 max_samples=65536, probability_tolerance=None,
+                 utility_tolerance=None, confidence=0.95, seed=None):
+        '''Estimate the probability of every consequence and the expected
+        utility when performing an action alone (all other actions are not
+        performed) by sampling the background conditions. This is meant for
+        models with too many variables to evaluate every assignment.
+
+        The samples are drawn in batches, which are evaluated all at once by
+        representing the values of a variable in a batch as bits of an
+        integer. Return a dictionary of the form
+            {
+                'samples': <NUMBER OF SAMPLES>,
+                'converged': <True, IF THE TOLERANCE WAS REACHED>,
+                'actions': {
+                    <ACTION>: {
+                        'utility': {'mean': ..., 'low': ..., 'high': ...},
+                        'consequences': {
+                            <CONSEQUENCE>: {'probability': ..., 'low': ...,
+                                            'high': ...},
+                            ...
+                            },
+                        },
+                    ...
+                    },
+            }
+        where low and high are the bounds of the confidence intervals. The
+        intervals of the probabilities are Wilson score intervals, those of
+        the utilities are computed from the means of the batches. Utilities
+        which are not set count as 0.
+
+        Arguments:
+        probabilities -- A dictionary which maps background conditions to the
+                         probability that they hold (0.5 for all others)
+        actions -- The actions to be estimated (all actions, if None)
+        batch_size -- The number of samples evaluated at once
+        max_samples -- The maximal number of samples
+        probability_tolerance -- Stop sampling as soon as all confidence
+                                 intervals of the probabilities are at most
+                                 twice this wide (and those of the utilities
+                                 reach their tolerance, if given)
+        utility_tolerance -- Stop sampling as soon as all confidence intervals
+                             of the utilities are at most twice this wide (and
+                             those of the probabilities reach their tolerance,
+                             if given). Sampling never stops early, if neither
+                             tolerance is given.
+        confidence -- The confidence level of the intervals
+        seed -- The seed of the random number generator
+        '''
+        if probabilities is None:
+            probabilities = {}
+        self.__verify_probabilities(probabilities)
+        if actions is None:
+            actions = self.__actions
+        for action in actions:
+            self.__verify_action(action, True)
+        # Every action is sampled once, even if it is given several times
+        actions = list(dict.fromkeys(actions))
+        for number in (batch_size, max_samples):
+            self.__check_type(number, int,
+                              'The numbers of samples must be integers.')
+            if number < 1:
+                raise ValueError('The numbers of samples must be positive.')
+        if not 0 < confidence < 1:
+            raise ValueError('The confidence must be between 0 and 1.')
+        for tolerance in (probability_tolerance, utility_tolerance):
+            if tolerance is not None and tolerance <= 0:
+                raise ValueError('The tolerances must be positive.')
+
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        rng = random.Random(seed)
+        order = self.__get_order()
+        utilities = dict(zip(self.__consequences,
+                             zip(*self.get_utility_vectors())))
+
+        counts = {action: dict.fromkeys(order, 0) for action in actions}
+        batches = {action: [] for action in actions}
+        samples = 0
+        converged = False
+
+        while samples < max_samples and not converged:
+            size = min(batch_size, max_samples - samples)
+            full = (1 << size) - 1
+
+            values = dict.fromkeys(self.__actions, 0)
+            for bg_condition in self.__background:
+                values[bg_condition] = self.__sample_bits(
+                    rng, size, probabilities.get(bg_condition, 0.5))
+
+            for action in actions:
+                values[action] = full
+                total = 0
+
+                # Following the topological order, the values of all variables
+                # of a mechanism are already known
+                for consequence in order:
+                    mechanism = self.__mechanisms.get(consequence)
+                    bits = full if mechanism else 0
+                    for variable in mechanism or ():
+                        bits &= values[variable]
+                    values[consequence] = bits
+
+                    held = bin(bits).count('1')
+                    counts[action][consequence] += held
+                    positive, negative = utilities[consequence]
+                    total += positive * held + negative * (size - held)
+
+                values[action] = 0
+                batches[action].append((size, total))
+
+            samples += size
+
+            if probability_tolerance is not None \
+                    or utility_tolerance is not None:
+                report = self.__estimates(counts, batches, samples, z)
+                converged = all(
+                    self.__within(probability_tolerance,
+                                  result['consequences'].values())
+                    and self.__within(utility_tolerance, [result['utility']])
+                    for result in report.values())
+
+        return {
+            'samples': samples,
+            'converged': converged,
+            'actions': self.__estimates(counts, batches, samples, z),
+            }
+
+    @_reading
+    def get_supports(self):
+        '''Get a dictionary which maps every consequence to the sorted list of
+        actions and background conditions it transitively depends on. Since
+        mechanisms are conjunctions, a consequence holds exactly if all of
+        them are true. Consequences which cannot be reached map to None.
+        '''
+        return {consequence: None if support is None else sorted(support)
+                for consequence, support in self.__get_supports().items()}
+
+    # MERGING ------------------------------------------------------------------
+    def diff(self, other):
+        '''Get the patch which turns this model into another model, e.g. to
+        sync the copy of a model in another process with apply_patch. The
+        patch is a json serializable dictionary with the optional entries
+            'description' -- The description of the other model
+            'remove' -- The parts to be removed
+            'add' -- The parts to be added
+            'utilities' -- The pairs of utilities of reaching and of not
+                           reaching the consequences whose utilities differ
+                           ([None, None] to remove them)
+        The parts map 'actions', 'background' and 'consequences' to lists of
+        names and 'mechanisms' and 'intentions' to dictionaries of lists.
+        Variables which are removed are removed from all mechanisms and
+        intentions as well, which is not repeated in the patch. The patch of
+        models with the same content and description is empty.
+
+        Arguments:
+        other -- The model the patch leads to
+        '''
+        # Both models are copied one after another, so that the locks of both
+        # models are never held at the same time
+        return self.__diff_content(self.__get_content(), other.__get_content())
+
+    @_writing
+    def apply_patch(self, patch):
+        '''Apply a patch returned by diff. The patch is applied completely or
+        not at all. Parts to be removed which are not in the model are ignored.
+        Raise a KeyError, if the patch adds mechanisms, intentions or utilities
+        of variables which are not in the model, and a ValueError, if it makes
+        the mechanisms cyclic.
+
+        Arguments:
+        patch -- A dictionary of the changes of the model
+        '''
+        content = self.__get_content()
+        self.__patch_content(content, patch)
+        self.__set_content(content)
+
+    def merge(self, other, overwrite=False):
+        '''Merge another model into this model, e.g. a model of further actions
+        on the same consequences. The parts of the other model which are not in
+        this model are added and the description is kept.
+        Return the conflicts of the models as list of dictionaries with the
+        entries
+            'kind' -- 'variable', if a variable is of another kind in the other
+                      model, 'mechanism', if a consequence has different
+                      mechanisms which are not empty, or 'utility', if a
+                      utility of a consequence is set to different values
+            'name' -- The name of the variable or consequence
+            'self' -- The kind of the variable ('actions', 'background' or
+                      'consequences'), the sorted mechanism or the pair of
+                      utilities of the consequence in this model
+            'other' -- The same in the other model
+        Variables keep their kind in this model.
+        Raise a ValueError and keep the model, if the merged mechanisms are
+        cyclic.
+
+        Arguments:
+        other -- The model to be merged into this model
+        overwrite -- True, if conflicting mechanisms and utilities are taken
+                     from the other model, False, if they are kept
+        '''
+        # The other model is copied first, so that the locks of both models are
+        # never held at the same time
+        source = other.__get_content()
+
+        with self.__lock.writing:
+            content = self.__get_content()
+            patch, conflicts = self.__merge_content(content, source, overwrite)
+            self.__patch_content(content, patch)
+            self.__set_content(content)
+
+        return conflicts
 
     # VERIFICATION METHODS -----------------------------------------------------
     def __verify_description(self, description):
@@ -518,6 +1218,38 @@ class Model:
             all_vars = self.__actions + self.__consequences + self.__background
             self.__check_if_in_model(variable, all_vars, 'variable')
 
+    def __verify_probabilities(self, probabilities):
+        '''Verify a dictionary of probabilities of background conditions.
+        Raise an error, if a probability is not valid.
+        '''
+        for bg_condition, probability in probabilities.items():
+            self.__verify_background(bg_condition, True)
+            self.__check_type(probability, (int, float),
+                              'A probability must be a number.')
+            if not 0 <= probability <= 1:
+                raise ValueError('A probability must be between 0 and 1.')
+
+    def __verify_assignment(self, assignment):
+        '''Verify an assignment.
+        Raise an error, if the assignment does not assign exactly the actions
+        and background conditions of the model a truth value.
+        '''
+        if set(assignment.keys()) < set(self.__actions + self.__background):
+            raise KeyError('The following variables have no assignment: {}'
+                           .format(set(self.__actions + self.__background) -
+                                   set(assignment.keys())))
+
+        if set(assignment.keys()) != set(self.__actions + self.__background):
+            raise KeyError('The assignment contains variables which are not in '
+                           + 'the model: {}'
+                           .format(set(assignment.keys()) -
+                                   set(self.__actions + self.__background)))
+
+        if not set(assignment.values()) <= {0, 1}:
+            raise ValueError('Assignments must assign either 0 or 1 to a '
+                             + 'variable. {} are no valid assignment values.'
+                             .format(set(assignment.values()) - {0, 1}))
+
     @staticmethod
     def __check_type(obj, obj_type, error_msg):
         '''A generic way for raising type errors.
@@ -558,6 +1290,26 @@ class Model:
         '''
         return 'Not(\'' + variable + '\')'
 
+    @classmethod
+    def __utility_key(cls, consequence, position):
+        '''Return the key of a utility of a consequence as used in the json
+        representation, i.e. c for reaching and Not('c') for not reaching the
+        consequence c.
+        '''
+        if position == cls.__AFFIRMATION:
+            return consequence
+
+        return cls.__not_str(consequence)
+
+    def __serialize_utilities(self):
+        '''Return the utilities as a dictionary which maps consequences c and
+        negated consequences Not('c') to their utilities.
+        '''
+        return {self.__utility_key(consequence, position): value
+                for consequence, pair in self.__utilities.items()
+                for position, value in enumerate(pair)
+                if value is not None}
+
     @staticmethod
     def __quote_str(variable):
         '''Reuturn a string of the form
@@ -587,40 +1339,868 @@ class Model:
 
         return curr
 
+    # CACHES -------------------------------------------------------------------
+    def __mechanisms_changed(self):
+        '''Drop all cached information derived from the mechanisms.'''
+        self.__supports = None
+
+    def __remove_from_mechanisms(self, variable):
+        '''Remove a variable from all mechanisms and track the mechanisms
+        which became empty.
+        '''
+        for consequence in self.__remove_item_from_list_dict(
+                variable, self.__mechanisms):
+            self.__track_issue('empty_mechanisms', consequence,
+                               not self.__mechanisms[consequence])
+            self.__hash_content(-1, 'mechanism', consequence, variable)
+
+        self.__mechanisms_changed()
+
+    def __get_supports(self):
+        '''Get a dictionary which maps every consequence to the set of actions
+        and background conditions it transitively depends on. Consequences
+        which cannot be reached map to None.
+        '''
+        if self.__supports is None:
+            supports = {}
+
+            # Following the topological order, the supports of all consequences
+            # a mechanism depends on are already known.
+            for consequence in self.__get_order():
+                variables = set()
+                for variable in self.__mechanisms.get(consequence, []):
+                    if variable not in supports:
+                        variables.add(variable)
+                    elif supports[variable] is None:
+                        break
+                    else:
+                        variables |= supports[variable]
+                else:
+                    if variables:
+                        supports[consequence] = frozenset(variables)
+                        continue
+
+                # Consequences with an empty mechanism or which depend on such
+                # a consequence cannot be reached
+                supports[consequence] = None
+
+            self.__supports = supports
+
+        return self.__supports
+
+    def __get_ranks(self):
+        '''Get the ranks of the consequences in the topological order and
+        build the dependency graph, if this was not done yet.
+        Raise an error, if the mechanisms are cyclic.
+        '''
+        if self.__ranks is None:
+            dependents, order = self.__sort_consequences()
+
+            if len(order) < len(self.__consequences):
+                raise RuntimeError('The mechanisms of the consequences {} are '
+                                   .format(sorted(set(self.__consequences)
+                                                  - set(order)))
+                                   + 'cyclic.')
+
+            # Assign the ranks last, since readers of a shared model may build
+            # the graph at the same time
+            self.__dependents = dependents
+            self.__next_rank = len(order)
+            self.__order = order
+            self.__ranks = {consequence: rank
+                            for rank, consequence in enumerate(order)}
+
+        return self.__ranks
+
+    def __sort_consequences(self):
+        '''Build the dependency graph of the consequences and sort them
+        topologically (Kahn's algorithm). Return the graph and the order, which
+        lacks all consequences with cyclic mechanisms.
+        '''
+        dependents = {consequence: set() for consequence in self.__consequences}
+        pending = dict.fromkeys(self.__consequences, 0)
+        for consequence in self.__consequences:
+            for variable in self.__mechanisms.get(consequence, []):
+                if variable in dependents:
+                    dependents[variable].add(consequence)
+                    pending[consequence] += 1
+
+        order = [consequence for consequence in self.__consequences
+                 if not pending[consequence]]
+        for consequence in order:
+            for dependent in dependents[consequence]:
+                pending[dependent] -= 1
+                if not pending[dependent]:
+                    order.append(dependent)
+
+        return dependents, order
+
+    def __get_order(self):
+        '''Get the cached topological order of the consequences.'''
+        ranks = self.__get_ranks()
+
+        if self.__order is None:
+            self.__order = sorted(ranks, key=ranks.get)
+
+        return self.__order
+
+    def __graph_add_consequence(self, consequence):
+        '''Add a new consequence without dependencies to the graph.'''
+        if self.__ranks is not None:
+            self.__dependents[consequence] = set()
+            self.__ranks[consequence] = self.__next_rank
+            self.__next_rank += 1
+
+            if self.__order is not None:
+                self.__order.append(consequence)
+
+    def __graph_remove_consequence(self, consequence):
+        '''Remove a consequence and its dependencies from the graph.
+        This has to be done before its mechanism is deleted.
+        '''
+        if self.__ranks is not None:
+            for variable in self.__mechanisms.get(consequence, []):
+                if variable in self.__dependents:
+                    self.__dependents[variable].discard(consequence)
+
+            # Removing a consequence keeps the order of all others valid
+            del self.__dependents[consequence]
+            del self.__ranks[consequence]
+            self.__order = None
+
+    def __graph_rename_consequence(self, con_old, con_new):
+        '''Rename a consequence in the graph.
+        This has to be done before its mechanism is renamed.
+        '''
+        if self.__ranks is not None:
+            for variable in self.__mechanisms.get(con_old, []):
+                if variable in self.__dependents:
+                    self.__dependents[variable].discard(con_old)
+                    self.__dependents[variable].add(con_new)
+
+            self.__rename_key(con_old, con_new, self.__dependents)
+            self.__rename_key(con_old, con_new, self.__ranks)
+
+            if self.__order is not None:
+                self.__rename_item_in_list(con_old, con_new, self.__order)
+
+    def __graph_check_dependency(self, consequence, variable):
+        '''Raise an error, if the dependency of a consequence on a variable
+        would make the mechanisms cyclic. Return the dependents of the
+        consequence ranked before the variable, which are moved behind it when
+        the dependency is added.
+        '''
+        ranks = self.__get_ranks()
+        if variable not in ranks:
+            return set()
+
+        cycle_error = ValueError('Adding {} to the mechanism of {} would '
+                                 .format(variable, consequence)
+                                 + 'make the mechanism cyclic.')
+
+        if variable == consequence:
+            raise cycle_error
+
+        forward = set()
+        if ranks[variable] > ranks[consequence]:
+            # If the variable is among the collected dependents, it depends on
+            # the consequence itself.
+            forward = self.__collect(
+                consequence, lambda con: self.__dependents[con],
+                lambda con: ranks[con] <= ranks[variable])
+            if variable in forward:
+                raise cycle_error
+
+        return forward
+
+    def __graph_add_dependency(self, consequence, variable):
+        '''Add the dependency of a consequence on a variable to the graph.
+        Raise an error, if the dependency would make the mechanisms cyclic.
+
+        The topological order is repaired with the algorithm of Pearce and
+        Kelly, which only reorders the consequences ranked between the two.
+        '''
+        forward = self.__graph_check_dependency(consequence, variable)
+
+        ranks = self.__get_ranks()
+        if variable not in ranks:
+            return
+
+        lower, upper = ranks[consequence], ranks[variable]
+
+        if upper > lower:
+            # Collect the dependencies of the variable ranked after the
+            # consequence and move them in front of the collected dependents
+            backward = self.__collect(
+                variable, lambda con: [var for var in self.__mechanisms.get(con, [])
+                                       if var in ranks],
+                lambda con: ranks[con] >= lower)
+
+            reordered = (sorted(backward, key=ranks.get)
+                         + sorted(forward, key=ranks.get))
+            for con, rank in zip(reordered,
+                                 sorted(ranks[con] for con in reordered)):
+                ranks[con] = rank
+
+            self.__order = None
+
+        self.__dependents[variable].add(consequence)
+
+    def __graph_remove_dependency(self, consequence, variable):
+        '''Remove the dependency of a consequence on a variable from the
+        graph. This keeps the topological order valid.
+        '''
+        if self.__ranks is not None and variable in self.__dependents:
+            self.__dependents[variable].discard(consequence)
+
+    @staticmethod
+    def __collect(start, neighbours, accept):
+        '''Collect all nodes reachable from a start node via accepted nodes.
+
+        Arguments:
+        start -- The node to start with
+        neighbours -- A function which returns the neighbours of a node
+        accept -- A function which decides whether a node is visited
+        '''
+        visited = {start}
+        stack = [start]
+        while stack:
+            for node in neighbours(stack.pop()):
+                if node not in visited and accept(node):
+                    visited.add(node)
+                    stack.append(node)
+
+        return visited
+
+    def __get_issues(self):
+        '''Get the sets of tracked issues of the model and build them, if
+        this was not done yet.
+        '''
+        if self.__issues is None:
+            consequences = set(self.__consequences)
+
+            usage = {
+                'unused_actions': dict.fromkeys(self.__actions, 0),
+                'unused_background': dict.fromkeys(self.__background, 0),
+                }
+            for mechanism in self.__mechanisms.values():
+                for variable in mechanism:
+                    for counts in usage.values():
+                        if variable in counts:
+                            counts[variable] += 1
+
+            issues = {
+                'dangling_intentions': {
+                    (action, consequence)
+                    for action, intended in self.__intentions.items()
+                    for consequence in intended
+                    if consequence != action
+                    and consequence not in consequences},
+                'empty_mechanisms': {
+                    consequence for consequence in self.__consequences
+                    if not self.__mechanisms.get(consequence)},
+                'missing_utilities': {
+                    consequence for consequence in self.__consequences
+                    if consequence not in self.__utilities},
+                }
+            for issue, counts in usage.items():
+                issues[issue] = {variable for variable, count
+                                 in counts.items() if not count}
+
+            # Assign the issues last, since readers of a shared model may build
+            # them at the same time
+            self.__usage = usage
+            self.__issues = issues
+
+        return self.__issues
+
+    def __get_intenders(self):
+        '''Get the dictionary which maps every intended consequence to the
+        actions intending it and build it, if this was not done yet. The
+        actions are the keys of a dictionary, so that they keep the order in
+        which the intentions were added and are removed in constant time.
+        '''
+        if self.__intenders is None:
+            intenders = {}
+            for action, intended in self.__intentions.items():
+                for consequence in intended:
+                    if consequence != action:
+                        intenders.setdefault(consequence, {})[action] = None
+
+            # Readers of a shared model may build the index at the same time,
+            # so it is only assigned when complete
+            self.__intenders = intenders
+
+        return self.__intenders
+
+    def __index_intention(self, action, consequence, present=True):
+        '''Add an intention to the index of the intentions or remove it from
+        the index, if the index was already built.
+
+        Arguments:
+        action -- The intending action
+        consequence -- The intended consequence
+        present -- True, if the intention was added, False otherwise
+        '''
+        if self.__intenders is not None and consequence != action:
+            if present:
+                self.__intenders.setdefault(consequence, {})[action] = None
+            elif action in self.__intenders.get(consequence, ()):
+                del self.__intenders[consequence][action]
+                if not self.__intenders[consequence]:
+                    del self.__intenders[consequence]
+
+    def __track_issue(self, issue, item, present=True):
+        '''Add an item to the tracked issues of a kind or remove it from them.
+
+        Arguments:
+        issue -- The kind of the issue
+        item -- The item which has the issue
+        present -- True, if the item has the issue, False otherwise
+        '''
+        if self.__issues is not None:
+            if present:
+                self.__issues[issue].add(item)
+            else:
+                self.__issues[issue].discard(item)
+
+    def __register_usage(self, issue, variable):
+        '''Start counting the mechanisms a new variable occurs in.
+
+        Arguments:
+        issue -- The issue reported, if the variable occurs in no mechanism
+        variable -- The new variable
+        '''
+        if self.__usage is not None:
+            self.__usage[issue][variable] = 0
+            self.__track_issue(issue, variable)
+
+    def __count_usage(self, variable, delta):
+        '''Change the number of mechanisms a variable occurs in.'''
+        if self.__usage is not None:
+            for issue, counts in self.__usage.items():
+                if variable in counts:
+                    counts[variable] += delta
+                    self.__track_issue(issue, variable, not counts[variable])
+
+    def __forget_issues(self, item):
+        '''Remove a removed action, background condition or consequence
+        from the tracked issues.
+        '''
+        if self.__issues is not None:
+            for counts in self.__usage.values():
+                counts.pop(item, None)
+
+            for items in self.__issues.values():
+                items.discard(item)
+
+            self.__issues['dangling_intentions'] = {
+                (action, consequence) for action, consequence
+                in self.__issues['dangling_intentions'] if action != item}
+
+    def __rename_issues(self, old, new):
+        '''Rename an item in the tracked issues.'''
+        if self.__issues is not None:
+            for counts in self.__usage.values():
+                self.__rename_key(old, new, counts)
+
+            for items in self.__issues.values():
+                if old in items:
+                    items.remove(old)
+                    items.add(new)
+
+            self.__issues['dangling_intentions'] = {
+                (new if action == old else action, consequence)
+                for action, consequence
+                in self.__issues['dangling_intentions']}
+
+    def __resolve_dangling_intentions(self, consequence):
+        '''Stop tracking intentions of a consequence, which was added to the
+        model.
+        '''
+        if self.__issues is not None:
+            self.__issues['dangling_intentions'] = {
+                (action, intended) for action, intended
+                in self.__issues['dangling_intentions']
+                if intended != consequence}
+
+    def __hash_content(self, sign, *part):
+        '''Add the hash of a part of the model to the fingerprint or subtract
+        it from the fingerprint, if the fingerprint was already computed.
+
+        Arguments:
+        sign -- 1, if the part was added, -1, if it was removed
+        *part -- The kind of the part and its content
+        '''
+        if self.__fingerprint is not None:
+            self.__fingerprint = ((self.__fingerprint
+                                   + sign * self.__hash_part(part))
+                                  % self.__FINGERPRINT_MODULUS)
+
+    @classmethod
+    def __hash_part(cls, part):
+        '''Return a stable hash of a part of the model as integer.'''
+        digest = hashlib.blake2b(json.dumps(part).encode(),
+                                 digest_size=cls.__FINGERPRINT_BYTES)
+
+        return int.from_bytes(digest.digest(), 'big')
+
+    @_reading
+    def __canonical_content(self):
+        '''Return the content of the model in a form which does not depend on
+        the order of its parts.
+        '''
+        return (frozenset(self.__actions),
+                frozenset(self.__background),
+                frozenset(self.__consequences),
+                {key: frozenset(mech) for key, mech in self.__mechanisms.items()},
+                {key: tuple(pair) for key, pair in self.__utilities.items()},
+                {key: frozenset(intended)
+                 for key, intended in self.__intentions.items()})
+
+    def __hash_utility(self, sign, consequence, position, value):
+        '''Add or subtract the hash of a utility of a consequence. The part is
+        hashed with its key of the form c or Not('c'), so that fingerprints do
+        not depend on how utilities are stored.
+        '''
+        if self.__fingerprint is not None:
+            self.__hash_content(sign, 'utility',
+                                self.__utility_key(consequence, position),
+                                value)
+
+    def __hash_utilities(self, sign, consequence, pair):
+        '''Add or subtract the hashes of the pair of utilities of a
+        consequence.'''
+        for position, value in enumerate(pair):
+            if value is not None:
+                self.__hash_utility(sign, consequence, position, value)
+
+    def __hash_list(self, sign, kind, key, item_list):
+        '''Add or subtract the hashes of all items of a mechanism or intention
+        list.
+        '''
+        for item in item_list:
+            self.__hash_content(sign, kind, key, item)
+
+    @staticmethod
+    def __sample_bits(rng, size, probability):
+        '''Return an integer of which each of the lowest size bits is set with
+        a probability.
+
+        The bits are built from random words of fair bits, one for every digit
+        of the binary expansion 0.d1d2...dk of the probability. Starting with
+        no bits set and the last digit, a word is combined with the bits by or,
+        if the digit is 1, and by and otherwise, which sets each bit with the
+        probability (d + p) / 2, where p is the probability before.
+        '''
+        if probability <= 0:
+            return 0
+        if probability >= 1:
+            return (1 << size) - 1
+
+        numerator, denominator = float(probability).as_integer_ratio()
+
+        bits = 0
+        for _ in range(denominator.bit_length() - 1):
+            if numerator & 1:
+                bits |= rng.getrandbits(size)
+            else:
+                bits &= rng.getrandbits(size)
+            numerator >>= 1
+
+        return bits
+
+    @staticmethod
+    def __within(tolerance, estimates):
+        '''Return True, if no confidence interval of the estimates is wider
+        than twice the tolerance or if the tolerance is None.'''
+        return tolerance is None or all(
+            estimate['high'] - estimate['low'] <= 2 * tolerance
+            for estimate in estimates)
+
+    @staticmethod
+    def __estimates(counts, batches, samples, z):
+        '''Return the estimated probabilities and utilities with confidence
+        intervals of the form returned by estimate().
+
+        Arguments:
+        counts -- The numbers of samples in which the consequences held per
+                  action
+        batches -- The list of pairs of size and total utility of every batch
+                   per action
+        samples -- The number of samples
+        z -- The quantile of the standard normal distribution of the
+             confidence level
+        '''
+        def wilson(held):
+            probability = held / samples
+            center = probability + z * z / (2 * samples)
+            spread = z * math.sqrt(probability * (1 - probability) / samples
+                                   + z * z / (4 * samples * samples))
+            scale = 1 + z * z / samples
+            return {
+                'probability': probability,
+                'low': max(0.0, (center - spread) / scale),
+                'high': min(1.0, (center + spread) / scale),
+                }
+
+        estimates = {}
+        for action, action_batches in batches.items():
+            mean = sum(total for _, total in action_batches) / samples
+
+            # The variance of a single sample is estimated from the deviations
+            # of the batch means, which needs at least two batches
+            if len(action_batches) > 1:
+                variance = (sum(size * (total / size - mean) ** 2
+                                for size, total in action_batches)
+                            / (len(action_batches) - 1))
+                spread = z * math.sqrt(variance / samples)
+            else:
+                spread = math.inf
+
+            estimates[action] = {
+                'utility': {'mean': mean, 'low': mean - spread,
+                            'high': mean + spread},
+                'consequences': {consequence: wilson(held) for consequence,
+                                 held in counts[action].items()},
+                }
+
+        return estimates
+
+    @staticmethod
+    def __holds(support, assignment):
+        '''Return 1, if all variables of a support are true under an
+        assignment and 0 otherwise. An unreachable (None) support never holds.
+        '''
+        if support is None:
+            return 0
+
+        return int(all(assignment[var] for var in support))
+
+    # PATCHES ------------------------------------------------------------------
+    # Patches are computed and applied on copies of the content of the models
+    # with sets and dictionaries, so that they take linear time in the size of
+    # the models.
+    __VARIABLE_KINDS = ('actions', 'background', 'consequences')
+    __LIST_DICT_KINDS = ('mechanisms', 'intentions')
+
+    @_reading
+    def __get_content(self):
+        '''Return a copy of the content and the description of the model as
+        dictionary in the form of the parts of a patch.
+        '''
+        return {
+            'description': self.__description,
+            'actions': list(self.__actions),
+            'background': list(self.__background),
+            'consequences': list(self.__consequences),
+            'mechanisms': {consequence: list(mechanism) for consequence,
+                           mechanism in self.__mechanisms.items()},
+            'utilities': {consequence: list(pair)
+                          for consequence, pair in self.__utilities.items()},
+            'intentions': {action: list(intended)
+                           for action, intended in self.__intentions.items()},
+            }
+
+    @classmethod
+    def __diff_content(cls, source, target):
+        '''Return the patch which turns the content of a model into the
+        content of another model.'''
+        remove = {}
+        add = {}
+        for kind in cls.__VARIABLE_KINDS:
+            old, new = set(source[kind]), set(target[kind])
+            remove[kind] = [name for name in source[kind] if name not in new]
+            add[kind] = [name for name in target[kind] if name not in old]
+
+        removed_variables = set().union(*(remove[kind]
+                                          for kind in cls.__VARIABLE_KINDS))
+        removed_consequences = set(remove['consequences'])
+
+        # Compare the lists with the lists left after the removal of the
+        # variables, which also removes them from mechanisms and intentions
+        for kind, owners, removed in (
+                ('mechanisms', 'consequences', removed_variables),
+                ('intentions', 'actions', removed_consequences)):
+            kept_owners = set(source[owners]) - set(remove[owners])
+            remove[kind] = {}
+            add[kind] = {}
+
+            for key, items in target[kind].items():
+                if key in kept_owners:
+                    old = [item for item in source[kind].get(key, [])
+                           if item not in removed]
+                else:
+                    # Mechanisms of new consequences are empty, intentions of
+                    # new actions contain the action
+                    old = [key] if kind == 'intentions' else []
+
+                old_items, new_items = set(old), set(items)
+                removed_items = [item for item in old if item not in new_items]
+                added_items = [item for item in items if item not in old_items]
+                if removed_items:
+                    remove[kind][key] = removed_items
+                if added_items:
+                    add[kind][key] = added_items
+
+        utilities = {}
+        for consequence in target['consequences']:
+            old = (None if consequence in removed_consequences
+                   else source['utilities'].get(consequence))
+            new = target['utilities'].get(consequence)
+            if old != new:
+                utilities[consequence] = new or [None, None]
+
+        patch = {}
+        if source['description'] != target['description']:
+            patch['description'] = target['description']
+        for entry, parts in (('remove', remove), ('add', add)):
+            parts = {kind: items for kind, items in parts.items() if items}
+            if parts:
+                patch[entry] = parts
+        if utilities:
+            patch['utilities'] = utilities
+
+        return patch
+
+    def __merge_content(self, target, source, overwrite):
+        '''Return the patch which merges the content of a model into the
+        content of this model and the conflicts of the models.'''
+        conflicts = []
+        add = {kind: [] for kind in self.__VARIABLE_KINDS}
+        remove = {'mechanisms': {}}
+
+        kinds = {name: kind for kind in self.__VARIABLE_KINDS
+                 for name in target[kind]}
+        for kind in self.__VARIABLE_KINDS:
+            for name in source[kind]:
+                if name not in kinds:
+                    add[kind].append(name)
+                elif kinds[name] != kind:
+                    conflicts.append({'kind': 'variable', 'name': name,
+                                      'self': kinds[name], 'other': kind})
+
+        actions = set(target['actions']).union(add['actions'])
+        consequences = set(target['consequences']).union(add['consequences'])
+
+        add['mechanisms'] = {}
+        for consequence, mechanism in source['mechanisms'].items():
+            if consequence not in consequences or not mechanism:
+                continue
+
+            own = target['mechanisms'].get(consequence, [])
+            if not own:
+                add['mechanisms'][consequence] = mechanism
+            elif set(own) != set(mechanism):
+                conflicts.append({'kind': 'mechanism', 'name': consequence,
+                                  'self': sorted(own),
+                                  'other': sorted(mechanism)})
+                if overwrite:
+                    remove['mechanisms'][consequence] = own
+                    add['mechanisms'][consequence] = mechanism
+
+        add['intentions'] = {
+            action: [consequence for consequence in intended
+                     if consequence in consequences]
+            for action, intended in source['intentions'].items()
+            if action in actions}
+
+        utilities = {}
+        for consequence, pair in source['utilities'].items():
+            if consequence not in consequences:
+                continue
+
+            own = target['utilities'].get(consequence, [None, None])
+            merged = list(own)
+            conflicting = False
+            for position, value in enumerate(pair):
+                if value is None or value == own[position]:
+                    continue
+                if own[position] is None or overwrite:
+                    merged[position] = value
+                conflicting = conflicting or own[position] is not None
+
+            if conflicting:
+                conflicts.append({'kind': 'utility', 'name': consequence,
+                                  'self': list(own), 'other': list(pair)})
+            if merged != own:
+                utilities[consequence] = merged
+
+        return {'remove': remove, 'add': add, 'utilities': utilities}, conflicts
+
+    def __patch_content(self, content, patch):
+        '''Apply a patch to a copy of the content of the model.
+        Raise an error, if the patch is not valid.
+        '''
+        remove = patch.get('remove', {})
+        add = patch.get('add', {})
+
+        if 'description' in patch:
+            self.__verify_description(patch['description'])
+            content['description'] = patch['description']
+
+        # Remove the variables and their mechanisms, utilities and intentions
+        removed = {kind: set(remove.get(kind, []))
+                   for kind in self.__VARIABLE_KINDS}
+        for kind in self.__VARIABLE_KINDS:
+            content[kind] = [name for name in content[kind]
+                             if name not in removed[kind]]
+
+        removed_variables = set().union(*removed.values())
+        content['mechanisms'] = {
+            consequence: [variable for variable in mechanism
+                          if variable not in removed_variables]
+            for consequence, mechanism in content['mechanisms'].items()
+            if consequence not in removed['consequences']}
+        content['utilities'] = {
+            consequence: pair
+            for consequence, pair in content['utilities'].items()
+            if consequence not in removed['consequences']}
+        content['intentions'] = {
+            action: [consequence for consequence in intended
+                     if consequence not in removed['consequences']]
+            for action, intended in content['intentions'].items()
+            if action not in removed['actions']}
+
+        for kind in self.__LIST_DICT_KINDS:
+            for key, items in remove.get(kind, {}).items():
+                if key in content[kind]:
+                    # The intentions of an action always contain the action
+                    items = set(items) - {key}
+                    content[kind][key] = [item for item in content[kind][key]
+                                          if item not in items]
+
+        # Add the variables, mechanisms, intentions and utilities
+        verify = {
+            'actions': self.__verify_action,
+            'background': self.__verify_background,
+            'consequences': self.__verify_consequence,
+            }
+        names = {}
+        for kind in self.__VARIABLE_KINDS:
+            names[kind] = set(content[kind])
+            for name in add.get(kind, []):
+                verify[kind](name)
+                if name not in names[kind]:
+                    names[kind].add(name)
+                    content[kind].append(name)
+
+                    if kind == 'actions':
+                        content['intentions'][name] = [name]
+                    elif kind == 'consequences':
+                        content['mechanisms'][name] = []
+
+        variables = set().union(*names.values())
+        for kind, owners, owner, members, member in (
+                ('mechanisms', names['consequences'], 'consequence',
+                 variables, 'variable'),
+                ('intentions', names['actions'], 'action',
+                 names['consequences'], 'consequence')):
+            for key, items in add.get(kind, {}).items():
+                self.__check_if_in_model(key, owners, owner)
+
+                item_list = content[kind][key]
+                present = set(item_list)
+                for item in items:
+                    self.__check_if_in_model(item, members, member)
+                    if item not in present:
+                        present.add(item)
+                        item_list.append(item)
+
+        for consequence, pair in patch.get('utilities', {}).items():
+            self.__check_if_in_model(consequence, names['consequences'],
+                                     'consequence')
+            value, not_value = pair
+            for utility in (value, not_value):
+                if utility is not None:
+                    self.__verify_utility(utility)
+
+            if value is None and not_value is None:
+                content['utilities'].pop(consequence, None)
+            else:
+                content['utilities'][consequence] = [value, not_value]
+
+    def __set_content(self, content):
+        '''Replace the content of the model with a patched copy and drop
+        everything derived from it.
+        Raise a ValueError and keep the model, if the mechanisms of the copy
+        are cyclic.
+        '''
+        previous = dict(vars(self))
+
+        self.__description = content['description']
+        self.__actions = content['actions']
+        self.__background = content['background']
+        self.__consequences = content['consequences']
+        self.__mechanisms = content['mechanisms']
+        self.__utilities = content['utilities']
+        self.__intentions = content['intentions']
+
+        self.__mechanisms_changed()
+        self.__dependents = None
+        self.__ranks = None
+        self.__order = None
+        self.__issues = None
+        self.__usage = None
+        self.__intenders = None
+        self.__fingerprint = None
+
+        try:
+            self.__get_ranks()
+        except RuntimeError as error:
+            vars(self).update(previous)
+            raise ValueError(*error.args) from None
+
     # LIST AND DICTIONARY MODIFIERS --------------------------------------------
     @staticmethod
     def __remove_item_from_list_dict(item, list_dict):
         '''Remove an item from all lists in a dictionary of lists.
+        Return the keys of the lists, which contained the item.
 
         Arguments:
         item -- A item that's to be removed from all lists in the dictionary
         list_dict -- A dictionary of lists
         '''
+        keys = []
         for variable, item_list in list_dict.items():
             if item in item_list:
                 list_dict[variable].remove(item)
+                keys.append(variable)
+
+        return keys
 
-    def __rename_item_in_list_dict(self, item_old, item_new, list_dict,
+    def __rename_item_in_list_dict(self, item_old, item_new, list_dict, kind,
                                    rename_keys=False):
         '''Replace all occurences of an item in all lists in a dictionary of
-        lists.
+        lists and update the fingerprint accordingly.
 
         Arguments:
         item_old -- The item that's to be replaced
         item_new -- The item that replaces the old item
         list_dict -- A dictionary of lists
+        kind -- The kind of the lists ('mechanism' or 'intention')
         rename_keys -- If True, the replacement also affects the dict keys.
         '''
         # Rename the dict keys
-        if rename_keys:
+        renamed_key = None
+        if rename_keys and item_old in list_dict:
+            self.__hash_list(-1, kind, item_old, list_dict[item_old])
             self.__rename_key(item_old, item_new, list_dict)
+            renamed_key = item_new
 
         # Replace all occurences of the old item with the new item
-        for item_list in list_dict.values():
+        for key, item_list in list_dict.items():
             for pos, item in enumerate(item_list):
                 if item == item_old:
                     item_list[pos] = item_new
 
+                    if key != renamed_key:
+                        self.__hash_content(-1, kind, key, item_old)
+                        self.__hash_content(1, kind, key, item_new)
+
+        if renamed_key is not None:
+            self.__hash_list(1, kind, renamed_key, list_dict[renamed_key])
+
     @staticmethod
     def __rename_item_in_list(item_old, item_new, item_list):
         '''Replace an item in a list with another item.
@@ -634,18 +2214,6 @@ class Model:
         pos = item_list.index(item_old)
         item_list[pos] = item_new
 
-    @staticmethod
-    def __append_if_new(item, item_list):
-        '''Append an item to a list, if this item is not already present in the
-        list.
-
-        Arguments:
-        item -- An item
-        item_list -- A list
-        '''
-        if item not in item_list:
-            item_list.append(item)
-
     @staticmethod
     def __rename_key(old, new, dictionary):
         '''Rename a key in a dictionary.
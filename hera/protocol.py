@@ -0,0 +1,113 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module handles the messages specified in messages.md by triggering the
+respective methods of a model.'''
+import itertools
+
+import stats
+
+# Request handlers for every pair of field and method. A handler is called with
+# the model and the arguments of the request.
+HANDLERS = {
+    ('module', 'RESET'): lambda model, args: model.reset(),
+
+    ('description', 'SET'): lambda model, args: model.set_description(args),
+    ('description', 'GET'): lambda model, args: model.get_description(),
+
+    ('action', 'ADD'): lambda model, args: model.add_actions(*args),
+    ('action', 'REMOVE'): lambda model, args: model.remove_actions(*args),
+    ('action', 'RENAME'):
+        lambda model, args: model.rename_action(args['old'], args['new']),
+    ('action', 'GET'): lambda model, args: model.get_actions(),
+
+    ('background', 'ADD'): lambda model, args: model.add_background(*args),
+    ('background', 'REMOVE'):
+        lambda model, args: model.remove_background(*args),
+    ('background', 'RENAME'):
+        lambda model, args: model.rename_background(args['old'], args['new']),
+    ('background', 'GET'): lambda model, args: model.get_background(),
+
+    ('consequence', 'ADD'):
+        lambda model, args: model.add_consequences(*args),
+    ('consequence', 'REMOVE'):
+        lambda model, args: model.remove_consequences(*args),
+    ('consequence', 'RENAME'):
+        lambda model, args: model.rename_consequence(args['old'],
+                                                     args['new']),
+    ('consequence', 'GET'): lambda model, args: model.get_consequences(),
+
+    ('mechanism', 'ADD'):
+        lambda model, args: model.add_mechanisms(args['consequence'],
+                                                 *args['variables']),
+    ('mechanism', 'REMOVE'):
+        lambda model, args: model.remove_mechanisms(args['consequence'],
+                                                    *args['variables']),
+    ('mechanism', 'GET'): lambda model, args: model.get_mechanisms(),
+
+    ('utility', 'SET'):
+        lambda model, args: model.set_utility(args['consequence'],
+                                              args['value'],
+                                              args.get('affirmation', True)),
+    ('utility', 'REMOVE'):
+        lambda model, args: model.remove_utility(args['consequence'],
+                                                 args.get('affirmation', True)),
+    ('utility', 'GET'): lambda model, args: model.get_utilities(),
+
+    ('intention', 'ADD'):
+        lambda model, args: model.add_intentions(args['action'],
+                                                 *args['consequences']),
+    ('intention', 'REMOVE'):
+        lambda model, args: model.remove_intentions(args['action'],
+                                                    *args['consequences']),
+    ('intention', 'GET'): lambda model, args: model.get_intentions(),
+
+    ('stats', 'SET'):
+        lambda model, args: stats.enable() if args else stats.disable(),
+    ('stats', 'RESET'): lambda model, args: stats.reset(),
+    ('stats', 'GET'): lambda model, args: stats.get_stats(),
+    }
+
+
+class Dispatcher:
+    '''This class represents the handling of request messages for a model.'''
+    def __init__(self, model):
+        '''Initialize the dispatcher with the model the requests refer to.'''
+        self.__model = model
+        self.__reply_ids = itertools.count()
+
+    def get_model(self):
+        '''Get the model the requests refer to.'''
+        return self.__model
+
+    def handle(self, message):
+        '''Handle a request message and return the reply message.
+        The result of a GET request is the return value of the triggered
+        method, the result of any other request is True, if it succeeded, and
+        False otherwise.
+
+        Arguments:
+        message -- A request message as dictionary
+        '''
+        query = message['query']
+        field, method = query['field'], query['method']
+
+        try:
+            handler = HANDLERS[(field, method)]
+
+            with stats.measure('protocol.{}.{}'.format(field, method)):
+                result = handler(self.__model, query.get('arguments'))
+
+            if method != 'GET':
+                result = True
+        except (KeyError, TypeError, ValueError, RuntimeError):
+            result = False
+
+        return {
+            'id': next(self.__reply_ids),
+            'type': 'reply',
+            'query': {
+                'reply_to': message['id'],
+                'result': result,
+                },
+            }
@@ -0,0 +1,241 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module provides a socket server which handles the messages specified
+in messages.md for a single model. Every message is sent as one line of json.
+
+Run it with
+    python3 server.py --port 9000
+or with 4 pre-forked worker processes which import the reasoner backend before
+they are forked with
+    python3 server.py --port 9000 --workers 4 --independent-workers --warm
+Every worker has its own copy of the model and its own reply cache, so
+multiple workers have to be selected explicitly with --independent-workers.
+'''
+import argparse
+import json
+import os
+import signal
+import socketserver
+import threading
+
+import backends
+from cache import LRUCache
+from model import Model
+import snapshot
+from protocol import Dispatcher
+
+
+class _MessageHandler(socketserver.StreamRequestHandler):
+    '''This class handles the messages of one connection.'''
+    def handle(self):
+        '''Reply to every request message received on the connection.'''
+        for line in self.rfile:
+            try:
+                message = json.loads(line.decode())
+                if not isinstance(message, dict):
+                    raise TypeError('A message must be a json object.')
+
+                # Robots which reconnect identify themselves by the client
+                # field, otherwise the connection identifies the client
+                client = message.get('client', self.client_address)
+                reply = self.server.handle_message(message, client)
+            except (ValueError, KeyError, TypeError):
+                # Ignore malformed messages
+                continue
+
+            self.wfile.write((json.dumps(reply) + '\n').encode())
+
+
+class Server(socketserver.ThreadingTCPServer):
+    '''This class represents a server which handles the requests of all its
+    connections on one model.
+
+    The replies are cached by client and message id for a while, so that a
+    retransmitted request gets the reply of the original request instead of
+    being handled twice.
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, model=None, reply_cache_size=4096,
+                 reply_ttl=60.0):
+        '''Initialize the server.
+
+        Arguments:
+        address -- The (host, port) tuple the server listens on
+        model -- The model the requests refer to (an empty model, if None).
+                 Since every connection is handled by its own thread, the
+                 model should be thread safe.
+        reply_cache_size -- The maximal number of cached replies
+        reply_ttl -- The number of seconds a reply is cached
+        '''
+        super().__init__(address, _MessageHandler)
+
+        if model is None:
+            model = Model('', thread_safe=True)
+
+        self.__dispatcher = Dispatcher(model)
+        self.__replies = LRUCache(reply_cache_size, reply_ttl)
+        self.__lock = threading.Lock()
+
+        # Events of the requests which are being handled, so that duplicates
+        # arriving meanwhile wait for their reply
+        self.__pending = {}
+
+    def get_model(self):
+        '''Get the model the requests refer to.'''
+        return self.__dispatcher.get_model()
+
+    def get_reply_cache_stats(self):
+        '''Get the counters and the size of the reply cache.'''
+        with self.__lock:
+            return self.__replies.get_stats()
+
+    def handle_message(self, message, client=None):
+        '''Handle a request message and return the reply message.
+        If the client sent a request with the same id before, the cached reply
+        is returned without handling the request again.
+
+        Arguments:
+        message -- A request message as dictionary
+        client -- A hashable identifier of the client which sent the message
+        '''
+        key = (client, message['id'])
+
+        while True:
+            with self.__lock:
+                reply = self.__replies.get(key)
+                if reply is not None:
+                    return reply
+
+                pending = self.__pending.get(key)
+                if pending is None:
+                    pending = self.__pending[key] = threading.Event()
+                    break
+
+            # Wait for the original request, or handle the request, if the
+            # original one failed
+            pending.wait()
+
+        try:
+            reply = self.__dispatcher.handle(message)
+
+            with self.__lock:
+                self.__replies.put(key, reply)
+        finally:
+            with self.__lock:
+                del self.__pending[key]
+            pending.set()
+
+        return reply
+
+
+def warm_up(backend=None):
+    '''Load a backend, so that the first export does not have to.
+
+    Arguments:
+    backend -- The name of the backend (the default backend, if None)
+    '''
+    backends.get_backend(backend).load()
+
+
+def serve(server, workers=1, independent=False):
+    '''Handle requests until the server is shut down or interrupted.
+    With more than one worker, the server process forks the workers, which
+    accept the connections on the same socket. Everything loaded before, e.g.
+    by warm_up(), is shared with the workers.
+    Every worker has its own copy of the model and its own reply cache, so the
+    requests of a client spread over several connections (like those of
+    client.Client) may change different models, and a retransmission may be
+    handled again by another worker. Therefore multiple workers are only
+    forked, if this is explicitly accepted, e.g. for clients which only read
+    the model or use one connection each. Raise a ValueError otherwise.
+
+    Arguments:
+    server -- The server, which is already bound to its address
+    workers -- The number of worker processes
+    independent -- True, if the workers may serve independent copies of the
+                   model
+    '''
+    if workers < 2:
+        server.serve_forever()
+        return
+
+    if not independent:
+        raise ValueError('Every worker serves its own copy of the model. Pass '
+                         'independent=True to fork {} workers anyway.'
+                         .format(workers))
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def main():
+    '''Parse the command line arguments and run the server.'''
+    parser = argparse.ArgumentParser(description='Serve a hera model.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--description', default='',
+                        help='the description of the served model')
+    parser.add_argument('--reply-cache-size', type=int, default=4096,
+                        help='the number of replies kept for retransmissions')
+    parser.add_argument('--reply-ttl', type=float, default=60.0,
+                        help='the number of seconds replies are kept')
+    parser.add_argument('--snapshot',
+                        help='serve the model of a snapshot file')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='the number of pre-forked worker processes, '
+                        'each with its own copy of the model')
+    parser.add_argument('--independent-workers', action='store_true',
+                        help='accept that every worker serves its own copy '
+                        'of the model and has its own reply cache (required '
+                        'for more than one worker)')
+    parser.add_argument('--warm', action='store_true',
+                        help='load the backend before serving')
+    parser.add_argument('--backend', default=backends.DEFAULT_BACKEND,
+                        choices=sorted(backends.BACKENDS),
+                        help='the backend loaded by --warm')
+    args = parser.parse_args()
+
+    if args.workers > 1 and not args.independent_workers:
+        parser.error('every worker serves its own copy of the model, so '
+                     'changes and retransmissions of a client using several '
+                     'connections may reach different models; pass '
+                     '--independent-workers to use multiple workers anyway')
+
+    if args.warm:
+        warm_up(args.backend)
+
+    if args.snapshot:
+        model = snapshot.load(args.snapshot, thread_safe=True)
+    else:
+        model = Model(args.description, thread_safe=True)
+
+    with Server((args.host, args.port), model, args.reply_cache_size,
+                args.reply_ttl) as server:
+        try:
+            serve(server, args.workers, args.independent_workers)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module saves models as compact binary snapshots and loads them again.
+
+A snapshot is much smaller and faster to load than the json representation of
+a model. It is opened through mmap and decoded lazily, so that opening even a
+large snapshot takes only milliseconds and processes which open the same
+snapshot share its pages.
+
+All numbers are little-endian. A snapshot starts with the header
+    magic       4 bytes     b'HERA'
+    version     uint16      VERSION
+    sections    uint16      number of sections
+    description uint32      string id of the description
+    offsets     uint64[]    offset of every section in the order of SECTIONS
+followed by the sections. Every string of the model is stored once in the
+string table and referenced by its id everywhere else:
+    strings         count, end offset of every string, utf-8 encoded strings
+    actions         count, string ids
+    background      count, string ids
+    consequences    count, string ids
+    mechanisms      count, key ids, start of every value list (count + 1),
+                    value ids
+    utilities       count, records of string id of the consequence, flags and
+                    value (int64)
+    intentions      like mechanisms
+Counts, offsets and ids are uint32 values.
+'''
+import array
+import mmap
+import struct
+import sys
+
+from model import Model
+
+MAGIC = b'HERA'
+VERSION = 1
+SECTIONS = ('strings', 'actions', 'background', 'consequences', 'mechanisms',
+            'utilities', 'intentions')
+
+_HEADER = struct.Struct('<4sHHI{}Q'.format(len(SECTIONS)))
+_COUNT = struct.Struct('<I')
+_UTILITY = struct.Struct('<IIq')
+
+# Flag of a utility record for the utility of not reaching the consequence
+_NEGATED = 1
+
+# Range of the utilities, which are stored as int64 values
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+# SAVING -----------------------------------------------------------------------
+def dumps(model):
+    '''Return the snapshot of a model as bytes.
+    Raise a ValueError, if a utility of the model is not an int64 value.
+    '''
+    strings = {}
+
+    def string_id(string):
+        if string not in strings:
+            strings[string] = len(strings)
+        return strings[string]
+
+    description = string_id(model.get_description())
+
+    sections = {
+        'actions': _pack_list(model.get_actions(), string_id),
+        'background': _pack_list(model.get_background(), string_id),
+        'consequences': _pack_list(model.get_consequences(), string_id),
+        'mechanisms': _pack_list_dict(model.get_mechanisms(), string_id),
+        'intentions': _pack_list_dict(model.get_intentions(), string_id),
+        }
+
+    records = []
+    for consequence, pair in model.get_utility_pairs().items():
+        for flags, value in zip((0, _NEGATED), pair):
+            if value is not None:
+                if not _INT64_MIN <= value <= _INT64_MAX:
+                    raise ValueError('The utility {} of {} does not fit into '
+                                     'a snapshot.'.format(value, consequence))
+                records.append(_UTILITY.pack(string_id(consequence), flags,
+                                             value))
+    sections['utilities'] = _COUNT.pack(len(records)) + b''.join(records)
+
+    # The string table is packed last, since it contains every string above
+    blob = [string.encode() for string in strings]
+    ends = []
+    end = 0
+    for encoded in blob:
+        end += len(encoded)
+        ends.append(end)
+    sections['strings'] = (_COUNT.pack(len(blob)) + _pack_ids(ends)
+                           + b''.join(blob))
+
+    offsets = []
+    offset = _HEADER.size
+    for section in SECTIONS:
+        offsets.append(offset)
+        offset += len(sections[section])
+
+    header = _HEADER.pack(MAGIC, VERSION, len(SECTIONS), description,
+                          *offsets)
+
+    return header + b''.join(sections[section] for section in SECTIONS)
+
+
+def save(model, filename):
+    '''Save the snapshot of a model to a file.'''
+    with open(filename, 'wb') as snapshot_file:
+        snapshot_file.write(dumps(model))
+
+
+def _pack_ids(ids):
+    '''Pack a list of integers as little-endian uint32 values.'''
+    packed = array.array('I', ids)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _pack_list(items, string_id):
+    '''Pack a list of strings as count and string ids.'''
+    return _COUNT.pack(len(items)) + _pack_ids(string_id(item)
+                                               for item in items)
+
+
+def _pack_list_dict(list_dict, string_id):
+    '''Pack a dictionary of lists of strings as count, key ids, starts of the
+    value lists and value ids.'''
+    keys = []
+    starts = [0]
+    values = []
+    for key, items in list_dict.items():
+        keys.append(string_id(key))
+        values.extend(string_id(item) for item in items)
+        starts.append(len(values))
+
+    return (_COUNT.pack(len(keys)) + _pack_ids(keys) + _pack_ids(starts)
+            + _pack_ids(values))
+
+
+# LOADING ----------------------------------------------------------------------
+class Snapshot:
+    '''This class represents an opened snapshot. Its parts are decoded when
+    they are first requested.
+
+    Use it as context manager to close the underlying file:
+        with snapshot.open_snapshot('model.snap') as snap:
+            actions = snap.get_actions()
+    '''
+    def __init__(self, buffer, close=None):
+        '''Initialize the snapshot.
+
+        Arguments:
+        buffer -- The snapshot as bytes-like object
+        close -- A function which releases the buffer, or None
+        '''
+        self.__buffer = memoryview(buffer)
+        self.__close = close
+        self.__parts = {}
+
+        # Release the view of the buffer, if the header is invalid, so that
+        # the caller can close the buffer
+        try:
+            self.__read_header()
+        except ValueError:
+            self.__buffer.release()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Release the underlying buffer. Parts which are already decoded
+        remain available.'''
+        self.__buffer.release()
+        if self.__close is not None:
+            self.__close()
+            self.__close = None
+
+    def get_description(self):
+        '''Get the description of the model.'''
+        return self.__string(self.__description)
+
+    def get_actions(self):
+        '''Get a copy of the actions of the model.'''
+        return list(self.__part('actions', self.__decode_list))
+
+    def get_background(self):
+        '''Get a copy of the background conditions of the model.'''
+        return list(self.__part('background', self.__decode_list))
+
+    def get_consequences(self):
+        '''Get a copy of the consequences of the model.'''
+        return list(self.__part('consequences', self.__decode_list))
+
+    def get_mechanisms(self):
+        '''Get a copy of the mechanisms of the model.'''
+        return {key: list(values) for key, values
+                in self.__part('mechanisms', self.__decode_list_dict).items()}
+
+    def get_utilities(self):
+        '''Get the utilities of the model as a dictionary which maps
+        consequences c and negated consequences Not('c') to their utilities.
+        '''
+        utilities = {}
+        for consequence, (value, not_value) in self.get_utility_pairs().items():
+            if value is not None:
+                utilities[consequence] = value
+            if not_value is not None:
+                utilities['Not(\'' + consequence + '\')'] = not_value
+
+        return utilities
+
+    def get_utility_pairs(self):
+        '''Get a copy of the utilities of the model as a dictionary which maps
+        every consequence with a utility to the pair of the utilities of
+        reaching and of not reaching it.
+        '''
+        return {consequence: tuple(pair) for consequence, pair
+                in self.__part('utilities', self.__decode_utilities).items()}
+
+    def get_intentions(self):
+        '''Get a copy of the intentions of the model.'''
+        return {key: list(values) for key, values
+                in self.__part('intentions', self.__decode_list_dict).items()}
+
+    def to_model(self, thread_safe=False):
+        '''Decode the whole snapshot into a new model.
+        Raise an error like Model.apply_patch, if the snapshot holds no valid
+        model.
+
+        Arguments:
+        thread_safe -- True, if the model is shared between threads
+        '''
+        # The parts are added as a single patch, which checks them like the
+        # add_* methods in linear time. The intentions of the added actions
+        # contain the actions already.
+        model = Model(self.get_description(), thread_safe)
+        model.apply_patch({
+            'add': {
+                'actions': self.get_actions(),
+                'background': self.get_background(),
+                'consequences': self.get_consequences(),
+                'mechanisms': self.get_mechanisms(),
+                'intentions': {
+                    action: [consequence for consequence in intended
+                             if consequence != action]
+                    for action, intended in self.get_intentions().items()},
+                },
+            'utilities': self.get_utility_pairs(),
+            })
+
+        return model
+
+    def __read_header(self):
+        '''Read the header and the offsets of the string table.
+        Raise a ValueError, if the buffer is no snapshot of a supported
+        version.
+        '''
+        if len(self.__buffer) < _HEADER.size:
+            raise ValueError('The snapshot is truncated.')
+
+        header = _HEADER.unpack_from(self.__buffer)
+        magic, version, sections, description = header[:4]
+
+        if magic != MAGIC:
+            raise ValueError('The data is no hera snapshot.')
+        if version != VERSION or sections != len(SECTIONS):
+            raise ValueError('The snapshot version {} is not supported.'
+                             .format(version))
+
+        self.__description = description
+        self.__offsets = dict(zip(SECTIONS, header[4:]))
+
+        count = self.__read_count(self.__offsets['strings'])
+        self.__strings = [None] * count
+        self.__string_ends = self.__read_ids(self.__offsets['strings']
+                                             + _COUNT.size, count)
+        self.__blob_offset = (self.__offsets['strings'] + _COUNT.size
+                              + 4 * count)
+
+    def __part(self, section, decode):
+        '''Return a decoded section, decoding it on first use.'''
+        if section not in self.__parts:
+            self.__parts[section] = decode(self.__offsets[section])
+        return self.__parts[section]
+
+    def __string(self, string_id):
+        '''Return a string of the string table, decoding it on first use.'''
+        if string_id >= len(self.__strings):
+            raise ValueError('The snapshot references an unknown string.')
+
+        string = self.__strings[string_id]
+        if string is None:
+            start = self.__string_ends[string_id - 1] if string_id else 0
+            end = self.__string_ends[string_id]
+            if start > end:
+                raise ValueError('The string table of the snapshot is '
+                                 'corrupt.')
+            self.__check_extent(self.__blob_offset + start, end - start)
+            string = str(self.__buffer[self.__blob_offset + start:
+                                       self.__blob_offset + end], 'utf-8')
+            self.__strings[string_id] = string
+        return string
+
+    def __check_extent(self, offset, size):
+        '''Raise a ValueError, if size bytes at an offset exceed the
+        snapshot.'''
+        if offset + size > len(self.__buffer):
+            raise ValueError('The snapshot is truncated.')
+
+    def __read_count(self, offset):
+        '''Read the count of a section at an offset.'''
+        self.__check_extent(offset, _COUNT.size)
+        return _COUNT.unpack_from(self.__buffer, offset)[0]
+
+    def __read_ids(self, offset, count):
+        '''Read count uint32 values at an offset.'''
+        self.__check_extent(offset, 4 * count)
+        ids = array.array('I')
+        ids.frombytes(self.__buffer[offset:offset + 4 * count])
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return ids
+
+    def __decode_list(self, offset):
+        '''Decode a list of strings.'''
+        count = self.__read_count(offset)
+        return [self.__string(string_id) for string_id
+                in self.__read_ids(offset + _COUNT.size, count)]
+
+    def __decode_list_dict(self, offset):
+        '''Decode a dictionary of lists of strings.'''
+        count = self.__read_count(offset)
+        offset += _COUNT.size
+        keys = self.__read_ids(offset, count)
+        starts = self.__read_ids(offset + 4 * count, count + 1)
+        if starts[0] or any(starts[index] > starts[index + 1]
+                            for index in range(count)):
+            raise ValueError('The snapshot is corrupt.')
+        values = [self.__string(string_id) for string_id
+                  in self.__read_ids(offset + 8 * count + 4, starts[-1])]
+
+        return {self.__string(key): values[starts[index]:starts[index + 1]]
+                for index, key in enumerate(keys)}
+
+    def __decode_utilities(self, offset):
+        '''Decode the utilities.'''
+        count = self.__read_count(offset)
+        offset += _COUNT.size
+        end = offset + count * _UTILITY.size
+        self.__check_extent(offset, end - offset)
+
+        utilities = {}
+        for string_id, flags, value in _UTILITY.iter_unpack(
+                self.__buffer[offset:end]):
+            pair = utilities.setdefault(self.__string(string_id),
+                                        [None, None])
+            pair[1 if flags & _NEGATED else 0] = value
+
+        return utilities
+
+
+def loads(data):
+    '''Return the model of a snapshot given as bytes.'''
+    with Snapshot(data) as snap:
+        return snap.to_model()
+
+
+def open_snapshot(filename):
+    '''Open a snapshot file through mmap and return it as Snapshot, which
+    decodes its parts lazily.'''
+    with open(filename, 'rb') as snapshot_file:
+        mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return Snapshot(mapped, mapped.close)
+    except ValueError:
+        mapped.close()
+        raise
+
+
+def load(filename, thread_safe=False):
+    '''Load the model of a snapshot file.
+
+    Arguments:
+    filename -- The name of the snapshot file
+    thread_safe -- True, if the model is shared between threads
+    '''
+    with open_snapshot(filename) as snap:
+        return snap.to_model(thread_safe)
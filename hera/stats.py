@@ -0,0 +1,198 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module provides opt-in latency and call count instrumentation.
+
+Classes registered with instrument() get their public methods wrapped by
+timing wrappers only while the instrumentation is enabled, so that disabled
+instrumentation costs nothing. Stages within methods are timed with
+    with stats.measure('name'):
+        ...
+which costs a single function call while the instrumentation is disabled.
+'''
+import functools
+import threading
+import time
+import types
+
+# Number of buckets of the latency histograms. Bucket i counts the calls which
+# took less than 2**i microseconds, the last bucket counts all slower calls.
+HISTOGRAM_BUCKETS = 32
+
+_enabled = False
+_lock = threading.Lock()
+_records = {}
+_classes = []
+_originals = {}
+
+
+class _Record:
+    '''This class represents the collected measurements of one method or
+    stage.'''
+    def __init__(self):
+        '''Initialize an empty record.'''
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, seconds):
+        '''Add the measurement of a call.'''
+        self.calls += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+        bucket = int(seconds * 1e6).bit_length()
+        self.histogram[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+
+    def as_dict(self):
+        '''Return the record as a json-serializable dictionary. The histogram
+        maps the upper bound of every non-empty bucket in microseconds to the
+        number of calls.
+        '''
+        return {
+            'calls': self.calls,
+            'total_seconds': self.total_seconds,
+            'max_seconds': self.max_seconds,
+            'histogram': {str(2 ** bucket): count
+                          for bucket, count in enumerate(self.histogram)
+                          if count},
+            }
+
+
+class _Measurement:
+    '''This class represents a context manager which records the time spent
+    within it.'''
+    def __init__(self, name):
+        '''Initialize the measurement of a named method or stage.'''
+        self.__name = name
+        self.__start = None
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        record(self.__name, time.perf_counter() - self.__start)
+
+
+class _NoMeasurement:
+    '''This class represents a context manager which does nothing. It is used
+    while the instrumentation is disabled.'''
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_MEASUREMENT = _NoMeasurement()
+
+
+def record(name, seconds):
+    '''Record the duration of a call of a named method or stage.'''
+    with _lock:
+        if name not in _records:
+            _records[name] = _Record()
+
+        _records[name].add(seconds)
+
+
+def measure(name):
+    '''Return a context manager which records the time spent within it, if the
+    instrumentation is enabled.
+
+    Arguments:
+    name -- The name of the measured stage
+    '''
+    if not _enabled:
+        return _NO_MEASUREMENT
+
+    return _Measurement(name)
+
+
+def instrument(cls):
+    '''Register a class whose public methods are instrumented while the
+    instrumentation is enabled. Return the class, so that this can be used as
+    a class decorator.
+    '''
+    with _lock:
+        _classes.append(cls)
+
+        if _enabled:
+            _wrap_methods(cls)
+
+    return cls
+
+
+def enable():
+    '''Enable the instrumentation.'''
+    global _enabled
+
+    # Protocol clients toggle the instrumentation from several threads, which
+    # must not wrap the methods twice
+    with _lock:
+        if not _enabled:
+            _enabled = True
+            for cls in _classes:
+                _wrap_methods(cls)
+
+
+def disable():
+    '''Disable the instrumentation. The collected measurements are kept.'''
+    global _enabled
+
+    with _lock:
+        if _enabled:
+            _enabled = False
+            for cls in _classes:
+                _unwrap_methods(cls)
+
+
+def is_enabled():
+    '''Return True, if the instrumentation is enabled.'''
+    return _enabled
+
+
+def reset():
+    '''Remove all collected measurements.'''
+    with _lock:
+        _records.clear()
+
+
+def get_stats():
+    '''Get the collected measurements as a dictionary which maps the names of
+    the methods and stages to their records.
+    '''
+    with _lock:
+        return {name: rec.as_dict() for name, rec in _records.items()}
+
+
+def _wrap_methods(cls):
+    '''Replace the public methods of a class with timing wrappers.'''
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not isinstance(method, types.FunctionType):
+            continue
+
+        _originals[(cls, name)] = method
+        setattr(cls, name, _timed(method, '{}.{}'.format(cls.__name__, name)))
+
+
+def _unwrap_methods(cls):
+    '''Restore the public methods of a class replaced by _wrap_methods.'''
+    for (wrapped_cls, name), method in list(_originals.items()):
+        if wrapped_cls is cls:
+            setattr(cls, name, method)
+            del _originals[(cls, name)]
+
+
+def _timed(method, name):
+    '''Return a wrapper of a method which records the duration of its calls.'''
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start)
+
+    return wrapper
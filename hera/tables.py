@@ -0,0 +1,411 @@
+# Authors: Lukas Halbritter <halbritl@informatik.uni-freiburg.de>,
+#          Windy Phung <phungw@informatik.uni-freiburg.de>
+# Copyright 2019
+'''This module shares the evaluation tables of models between processes.
+
+An evaluation table holds everything needed to evaluate a model: the support
+of every consequence (the actions and background conditions it transitively
+depends on) and the utility vector. Since mechanisms are conjunctions, the
+supports determine the whole truth table of the consequences, which itself
+would grow exponentially with the number of actions and background
+conditions.
+
+A TableStore writes the table of a model to a file in a directory, named by
+the fingerprint of the model. Every process using the same directory maps the
+file into memory instead of computing the table again, and the arrays of the
+table are read from the shared pages without copying. A table is only built
+again, when the content of the model changes. Every store keeps a bounded
+number of tables open and removes the files of the tables it closes, so that
+neither the mappings nor the directory grow while models are changed.
+
+A table file starts with the header
+    magic           4 bytes     b'HERT'
+    version         uint16      VERSION
+    byte order      uint16      1 for little-endian, 2 for big-endian arrays
+    fingerprint     16 bytes    fingerprint of the model
+    variables       uint32      number of actions and background conditions
+    consequences    uint32      number of consequences
+    names           uint64      length of the names
+followed by the names of the variables and consequences as json list, the
+flags of every consequence (uint8), the start of every support (uint32,
+consequences + 1), the variable indices of the supports (uint32) and the
+utilities (int64, affirmation and negation of every consequence). The arrays
+are aligned to 8 bytes.
+'''
+import array
+import collections
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = b'HERT'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHH16sIIQ')
+_BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+# Flags of a consequence
+_UNREACHABLE = 1
+_UTILITY = 2
+_NOT_UTILITY = 4
+
+
+def _align(offset):
+    '''Return the next offset which is a multiple of 8.'''
+    return -(-offset // 8) * 8
+
+
+def dumps(model):
+    '''Return the evaluation table of a model as bytes.'''
+    return _dumps_current(model)[1]
+
+
+def _dumps_current(model):
+    '''Return the fingerprint of a model and its evaluation table as bytes.
+    The fingerprint is the one of the content in the table, which may be newer
+    than the fingerprint of the model before the call.
+    '''
+    # Repeat reading the model, if it was changed meanwhile by another thread
+    while True:
+        fingerprint = model.get_fingerprint()
+        content = _dumps(model, fingerprint)
+        if model.get_fingerprint() == fingerprint:
+            return fingerprint, content
+
+
+def _dumps(model, fingerprint):
+    '''Return the evaluation table of a model with a fingerprint as bytes.'''
+    variables = model.get_actions() + model.get_background()
+    supports = model.get_supports()
+    utilities = model.get_utility_pairs()
+    consequences = list(supports)
+
+    indices = {variable: index for index, variable in enumerate(variables)}
+    flags = bytearray(len(consequences))
+    starts = [0]
+    support_indices = []
+    values = []
+
+    for index, consequence in enumerate(consequences):
+        support = supports[consequence]
+        if support is None:
+            flags[index] |= _UNREACHABLE
+        else:
+            support_indices.extend(indices[variable] for variable in support)
+        starts.append(len(support_indices))
+
+        for flag, value in zip((_UTILITY, _NOT_UTILITY),
+                               utilities.get(consequence, (None, None))):
+            if value is not None:
+                flags[index] |= flag
+            values.append(value or 0)
+
+    names = json.dumps(variables + consequences).encode()
+    header = _HEADER.pack(MAGIC, VERSION, _BYTE_ORDER,
+                          fingerprint.to_bytes(16, 'big'), len(variables),
+                          len(consequences), len(names))
+
+    parts = [header + names, bytes(flags), array.array('I', starts),
+             array.array('I', support_indices), array.array('q', values)]
+
+    content = bytearray()
+    for part in parts:
+        content += bytes(_align(len(content)) - len(content))
+        content += bytes(part)
+
+    return bytes(content)
+
+
+class EvaluationTable:
+    '''This class represents the evaluation table of a model.
+
+    Use it as context manager to close the underlying file:
+        with EvaluationTable(mapped_file) as table:
+            values = table.evaluate(assignment)
+    '''
+    def __init__(self, buffer, close=None):
+        '''Initialize the table.
+
+        Arguments:
+        buffer -- The table as bytes-like object
+        close -- A function which releases the buffer, or None
+        '''
+        self.__buffer = memoryview(buffer)
+        self.__close = close
+        self.__flags = None
+        self.__starts = None
+        self.__supports = None
+        self.__utilities = None
+
+        # Release the views of the buffer, if the table is invalid, so that
+        # the caller can close the buffer
+        try:
+            self.__read()
+        except ValueError:
+            self.__release()
+            raise
+
+    def __read(self):
+        '''Read the header, the names and the views of the arrays.
+        Raise a ValueError, if the buffer is no evaluation table of a
+        supported version.
+        '''
+        if len(self.__buffer) < _HEADER.size:
+            raise ValueError('The evaluation table is truncated.')
+
+        (magic, version, byte_order, fingerprint, num_variables,
+         num_consequences, names_length) = _HEADER.unpack_from(self.__buffer)
+
+        if magic != MAGIC:
+            raise ValueError('The data is no hera evaluation table.')
+        if version != VERSION or byte_order != _BYTE_ORDER:
+            raise ValueError('The evaluation table version {} is not '
+                             'supported.'.format(version))
+
+        self.__fingerprint = int.from_bytes(fingerprint, 'big')
+
+        offset = _HEADER.size + names_length
+        if offset > len(self.__buffer):
+            raise ValueError('The evaluation table is truncated.')
+        try:
+            names = json.loads(str(self.__buffer[_HEADER.size:offset],
+                                   'utf-8'))
+        except ValueError:
+            raise ValueError('The names of the evaluation table are '
+                             'corrupt.') from None
+        if len(names) != num_variables + num_consequences:
+            raise ValueError('The names of the evaluation table are '
+                             'corrupt.')
+        self.__variables = names[:num_variables]
+        self.__consequences = names[num_variables:]
+
+        # The arrays are views of the buffer, so nothing is copied
+        self.__flags, offset = self.__view(offset, 'B', num_consequences)
+        self.__starts, offset = self.__view(offset, 'I', num_consequences + 1)
+        self.__supports, offset = self.__view(offset, 'I',
+                                              self.__starts[-1])
+        self.__utilities, offset = self.__view(offset, 'q',
+                                               2 * num_consequences)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Release the underlying buffer.'''
+        self.__release()
+
+        if self.__close is not None:
+            self.__close()
+            self.__close = None
+
+    def get_fingerprint(self):
+        '''Get the fingerprint of the model of the table.'''
+        return self.__fingerprint
+
+    def get_consequences(self):
+        '''Get a copy of the consequences of the table.'''
+        return list(self.__consequences)
+
+    def get_utilities(self):
+        '''Get the utilities of the table as a dictionary which maps
+        consequences c and negated consequences Not('c') to their utilities.
+        '''
+        utilities = {}
+        for index, consequence in enumerate(self.__consequences):
+            if self.__flags[index] & _UTILITY:
+                utilities[consequence] = self.__utilities[2 * index]
+            if self.__flags[index] & _NOT_UTILITY:
+                utilities['Not(\'' + consequence + '\')'] = \
+                    self.__utilities[2 * index + 1]
+
+        return utilities
+
+    def evaluate(self, assignment):
+        '''Evaluate the consequences for an assignment like Model.evaluate.
+        Return a dictionary which maps every consequence to 1, if it holds
+        under the assignment, and to 0 otherwise.
+
+        Arguments:
+        assignment -- A dictionary that assigns each action and background
+                      condition a truth value
+        '''
+        values = [assignment[variable] for variable in self.__variables]
+
+        return {consequence: self.__holds(index, values)
+                for index, consequence in enumerate(self.__consequences)}
+
+    def get_utility(self, assignment):
+        '''Get the total utility of the consequences under an assignment, i.e.
+        the sum of the utilities of the consequences which hold and of the
+        negated consequences which do not hold.
+
+        Arguments:
+        assignment -- A dictionary that assigns each action and background
+                      condition a truth value
+        '''
+        values = [assignment[variable] for variable in self.__variables]
+
+        return sum(self.__utilities[2 * index + 1 - self.__holds(index, values)]
+                   for index in range(len(self.__consequences)))
+
+    def __release(self):
+        '''Release all views of the buffer.'''
+        for view in (self.__flags, self.__starts, self.__supports,
+                     self.__utilities, self.__buffer):
+            if view is not None:
+                view.release()
+
+    def __holds(self, index, values):
+        '''Return 1, if the consequence with an index holds under the values
+        of the variables and 0 otherwise.'''
+        if self.__flags[index] & _UNREACHABLE:
+            return 0
+
+        support = self.__supports[self.__starts[index]:
+                                  self.__starts[index + 1]]
+
+        return int(all(values[variable] for variable in support))
+
+    def __view(self, offset, typecode, count):
+        '''Return a view of count numbers of a type at the next aligned offset
+        and the offset after it.'''
+        start = _align(offset)
+        end = start + struct.calcsize(typecode) * count
+        if end > len(self.__buffer):
+            raise ValueError('The evaluation table is truncated.')
+
+        return self.__buffer[start:end].cast(typecode), end
+
+
+def loads(data):
+    '''Return the evaluation table given as bytes.'''
+    return EvaluationTable(data)
+
+
+class TableStore:
+    '''This class represents a directory of evaluation tables shared by all
+    processes using it.'''
+    def __init__(self, directory=None, max_tables=8):
+        '''Initialize the store.
+
+        Arguments:
+        directory -- The directory of the table files (a directory in the
+                     temporary directory of the system, if None)
+        max_tables -- The maximum number of open tables. The table got least
+                      recently is closed and its file removed, when another
+                      table is opened.
+        '''
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'hera-tables')
+        if max_tables < 1:
+            raise ValueError('A store must keep at least one table open.')
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.__directory = directory
+        self.__max_tables = max_tables
+        self.__tables = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_directory(self):
+        '''Get the directory of the table files.'''
+        return self.__directory
+
+    def get_table(self, model):
+        '''Get the evaluation table of a model. The table is mapped from its
+        file, which is written first, if no process did this before.
+        The table must not be used any more, after max_tables other tables were
+        got from the store.
+
+        Arguments:
+        model -- The model of which the table is returned
+        '''
+        fingerprint = model.get_fingerprint()
+
+        # Another process may remove the file before it is opened, then it is
+        # written again. If the model was changed meanwhile, the table of the
+        # written content is got instead.
+        while fingerprint not in self.__tables:
+            table = self.__open(fingerprint)
+            if table is None:
+                fingerprint = self.__write(model)
+                continue
+
+            self.__tables[fingerprint] = table
+            if len(self.__tables) > self.__max_tables:
+                self.__evict()
+
+        self.__tables.move_to_end(fingerprint)
+        return self.__tables[fingerprint]
+
+    def close(self):
+        '''Close all tables opened by the store. The files are kept for other
+        processes.'''
+        for table in self.__tables.values():
+            table.close()
+        self.__tables.clear()
+
+    def __evict(self):
+        '''Close the table got least recently and remove its file. Processes
+        which mapped the file keep their table, others write it again.'''
+        fingerprint, table = self.__tables.popitem(last=False)
+        table.close()
+
+        try:
+            os.remove(self.__filename(fingerprint))
+        except FileNotFoundError:
+            pass
+
+    def __filename(self, fingerprint):
+        '''Return the name of the file of the table of a fingerprint.'''
+        return os.path.join(self.__directory,
+                            '{:032x}.table'.format(fingerprint))
+
+    def __write(self, model):
+        '''Write the table of a model to the file named by the fingerprint of
+        the written content and return this fingerprint.'''
+        fingerprint, content = _dumps_current(model)
+
+        # Write to a temporary file first, so that other processes never see
+        # a partial table
+        tmp_fd, tmp_filename = tempfile.mkstemp(dir=self.__directory)
+        with os.fdopen(tmp_fd, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_filename, self.__filename(fingerprint))
+
+        return fingerprint
+
+    def __open(self, fingerprint):
+        '''Map the table file of a fingerprint into memory and return it as
+        EvaluationTable. Return None, if there is no file or if it holds the
+        table of another fingerprint.
+        '''
+        try:
+            with open(self.__filename(fingerprint), 'rb') as table_file:
+                mapped = mmap.mmap(table_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+        try:
+            table = EvaluationTable(mapped, mapped.close)
+        except ValueError:
+            mapped.close()
+            raise
+
+        if table.get_fingerprint() != fingerprint:
+            table.close()
+            return None
+
+        return table
@@ -1,5 +1,25 @@
+import asyncio
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from cache import LRUCache
+import client
+import loadtest
 from model import Model
+from protocol import Dispatcher
+import server
+from server import Server
+import snapshot
+import tables
+from tables import TableStore
+import stats
 
 class TestModel(unittest.TestCase):
     def setUp(self):
@@ -18,14 +38,10 @@ class TestModel(unittest.TestCase):
                 }
 
         self.test_model._Model__utilities = {
-                'C1': 10,
-                'C2': -4,
-                'C3': 10,
-                'C4': -4,
-                'Not(\'C1\')': -10,
-                'Not(\'C2\')': 4,
-                'Not(\'C3\')': -10,
-                'Not(\'C4\')': 4,
+                'C1': [10, -10],
+                'C2': [-4, 4],
+                'C3': [10, -10],
+                'C4': [-4, 4],
                 }
 
         self.test_model._Model__intentions = {
@@ -102,11 +118,179 @@ class TestModel(unittest.TestCase):
         self.assertDictEqual({}, self.test_model._Model__intentions)
 
     def test_check(self):
-        pass
+        '''Test check method.'''
+        report = {
+            'cyclic_mechanisms': [],
+            'dangling_intentions': {},
+            'empty_mechanisms': [],
+            'missing_utilities': [],
+            'unused_actions': ['A3'],
+            'unused_background': [],
+            }
+        self.assertDictEqual(report, self.test_model.check())
+
+        # The report is kept up to date
+        self.test_model.add_consequences('C5')
+        self.test_model.add_background('B2')
+        self.test_model.remove_mechanisms('C2', 'A1')
+        self.test_model.remove_utility('C3')
+        self.test_model.remove_utility('C4', False)
+        report.update({
+            'empty_mechanisms': ['C2', 'C5'],
+            'missing_utilities': ['C5'],
+            'unused_background': ['B2'],
+            })
+        self.assertDictEqual(report, self.test_model.check())
+
+        self.test_model.add_mechanisms('C5', 'A3', 'B2')
+        self.test_model.rename_consequence('C2', 'C6')
+        self.test_model.remove_utility('C3', False)
+        self.test_model.remove_background('B1')
+        report.update({
+            'empty_mechanisms': ['C6'],
+            'missing_utilities': ['C3', 'C5'],
+            'unused_actions': [],
+            'unused_background': [],
+            })
+        self.assertDictEqual(report, self.test_model.check())
+
+        # Dangling intentions and missing mechanism entries
+        self.test_model = Model('Test')
+        self.test_model._Model__actions = ['A1']
+        self.test_model._Model__consequences = ['C1']
+        self.test_model._Model__intentions = {'A1': ['A1', 'C1', 'C2']}
+        self.assertDictEqual({'A1': ['C2']},
+                             self.test_model.check()['dangling_intentions'])
+        self.assertListEqual(['C1'],
+                             self.test_model.check()['empty_mechanisms'])
+        self.test_model.add_consequences('C2')
+        self.assertDictEqual({}, self.test_model.check()['dangling_intentions'])
+
+        # Cyclic mechanisms
+        self.test_model._Model__mechanisms = {'C1': ['C2'], 'C2': ['C1']}
+        self.test_model._Model__ranks = None
+        self.assertListEqual(['C1', 'C2'],
+                             self.test_model.check()['cyclic_mechanisms'])
+
+    def test_get_topological_order(self):
+        '''Test get_topological_order method.'''
+        self.test_model.add_consequences('C5', 'C6')
+        self.test_model.add_mechanisms('C2', 'C5')
+        self.test_model.add_mechanisms('C5', 'C6')
+        self.test_model.add_mechanisms('C1', 'C2', 'C6')
+
+        order = self.test_model.get_topological_order()
+        self.assertCountEqual(['C1', 'C2', 'C3', 'C4', 'C5', 'C6'], order)
+        for dependency, dependent in [('C6', 'C5'), ('C5', 'C2'),
+                                      ('C2', 'C1'), ('C6', 'C1')]:
+            self.assertLess(order.index(dependency), order.index(dependent))
+
+        # The order is kept up to date
+        self.test_model.rename_consequence('C5', 'C7')
+        self.test_model.remove_consequences('C2')
+        order = self.test_model.get_topological_order()
+        self.assertCountEqual(['C1', 'C3', 'C4', 'C6', 'C7'], order)
+        self.assertLess(order.index('C6'), order.index('C7'))
+        self.assertLess(order.index('C6'), order.index('C1'))
 
     def test_export(self):
         pass
 
+    def test_get_fingerprint(self):
+        '''Test get_fingerprint method.'''
+        fingerprint = self.test_model.get_fingerprint()
+
+        # The fingerprint does not depend on the order of the parts
+        model = Model('Other')
+        model.add_background('B1')
+        model.add_actions('A3', 'A2', 'A1')
+        model.add_consequences('C4', 'C3', 'C2', 'C1')
+        model.add_mechanisms('C1', 'A1', 'B1')
+        model.add_mechanisms('C2', 'A1')
+        model.add_mechanisms('C3', 'A2', 'B1')
+        model.add_mechanisms('C4', 'A2')
+        model.add_intentions('A1', 'C1')
+        model.add_intentions('A2', 'C3')
+        for consequence, value in [('C1', 10), ('C2', -4), ('C3', 10),
+                                   ('C4', -4)]:
+            model.set_utility(consequence, value)
+            model.set_utility(consequence, -value, False)
+        self.assertEqual(fingerprint, model.get_fingerprint())
+        self.assertEqual(self.test_model, model)
+        self.assertEqual(1, len({self.test_model, model}))
+
+        # The fingerprint is stable across processes
+        self.assertEqual(0x2a1eae5051abcd4c1bd3f79f50f424f9, fingerprint)
+
+        model.set_utility('C1', 11)
+        self.assertNotEqual(self.test_model, model)
+        self.assertNotEqual(self.test_model, 'Test')
+
+        # The fingerprint is updated on every mutation
+        mutations = [
+            ('add_actions', 'A4'), ('rename_action', 'A1', 'A5'),
+            ('remove_actions', 'A2'), ('add_background', 'B2'),
+            ('rename_background', 'B1', 'B3'), ('remove_background', 'B2'),
+            ('add_consequences', 'C5'), ('add_mechanisms', 'C5', 'C1', 'A3'),
+            ('rename_consequence', 'C1', 'C6'), ('remove_mechanisms', 'C5',
+                                                 'A3'),
+            ('set_utility', 'C5', 3), ('set_utility', 'C5', 2, False),
+            ('remove_utility', 'C3'), ('add_intentions', 'A3', 'C5'),
+            ('remove_intentions', 'A5', 'C6'), ('remove_consequences', 'C6'),
+            ]
+        for method, *arguments in mutations:
+            fingerprint = self.test_model.get_fingerprint()
+            getattr(self.test_model, method)(*arguments)
+            self.assertNotEqual(fingerprint, self.test_model.get_fingerprint())
+
+            fingerprint = self.test_model.get_fingerprint()
+            self.test_model._Model__fingerprint = None
+            self.assertEqual(fingerprint, self.test_model.get_fingerprint())
+
+    def test_evaluate_cache(self):
+        '''Test evaluate method with a cache.'''
+        cache = LRUCache(1)
+        assignment = {'A1': 1, 'A2': 0, 'A3': 0, 'B1': 1}
+        values = self.test_model.evaluate(assignment, cache)
+        self.assertDictEqual(values,
+                             self.test_model.evaluate(assignment, cache))
+        self.assertDictEqual({'hits': 1, 'misses': 1, 'evictions': 0,
+                              'expirations': 0, 'size': 1, 'maxsize': 1},
+                             cache.get_stats())
+
+        # Changing the model changes the key
+        self.test_model.remove_mechanisms('C1', 'B1')
+        assignment['B1'] = 0
+        self.assertEqual(1, self.test_model.evaluate(assignment, cache)['C1'])
+        self.assertEqual(1, cache.get_stats()['evictions'])
+
+    def test_export_native(self):
+        '''Test export method with the native backend.'''
+        cache = LRUCache()
+        assignment = {'A1': 1, 'A2': 0, 'A3': 0, 'B1': 1}
+        exported = self.test_model.export(assignment, cache, 'native')
+
+        self.assertTrue(exported.holds('C1'))
+        self.assertFalse(exported.holds('A2'))
+        self.assertEqual(10 - 4 - 10 + 4, exported.get_utility())
+        self.assertDictEqual({'A1': ['C1']},
+                             exported.get_intended_consequences())
+        self.assertIs(exported, self.test_model.export(assignment, cache,
+                                                       'native'))
+
+        # Error raising
+        self.assertRaises(KeyError, self.test_model.export, assignment,
+                          backend='unknown')
+
+    def test_import(self):
+        '''Test that importing the model does not import the reasoner.'''
+        statement = ('import sys, model, server; '
+                     'sys.exit(\'ethics.semantics\' in sys.modules)')
+        self.assertEqual(0, subprocess.run([sys.executable, '-c', statement],
+                                           cwd=os.path.dirname(
+                                               os.path.abspath(__file__))
+                                           ).returncode)
+
     # DESCRITPION --------------------------------------------------------------
     def test_set_description(self):
         '''Test set_description method.'''
@@ -254,9 +438,7 @@ class TestModel(unittest.TestCase):
                              self.test_model._Model__consequences)
         self.assertDictEqual({'C2': ['A1'], 'C3': ['B1', 'A2'], 'C4': ['A2']},
                              self.test_model._Model__mechanisms)
-        self.assertDictEqual({'C2': -4, 'C3': 10, 'C4': -4,
-                              'Not(\'C2\')': 4, 'Not(\'C3\')': -10,
-                              'Not(\'C4\')': 4},
+        self.assertDictEqual({'C2': [-4, 4], 'C3': [10, -10], 'C4': [-4, 4]},
                              self.test_model._Model__utilities)
         self.assertDictEqual({'A1': ['A1'], 'A2': ['A2', 'C3'], 'A3': ['A3']},
                              self.test_model._Model__intentions)
@@ -266,12 +448,17 @@ class TestModel(unittest.TestCase):
         self.assertListEqual(['C3', 'C4'], self.test_model._Model__consequences)
         self.assertDictEqual({'C3': ['B1', 'A2'], 'C4': ['A2']},
                              self.test_model._Model__mechanisms)
-        self.assertDictEqual({'C3': 10, 'C4': -4,
-                              'Not(\'C3\')': -10, 'Not(\'C4\')': 4},
+        self.assertDictEqual({'C3': [10, -10], 'C4': [-4, 4]},
                              self.test_model._Model__utilities)
         self.assertDictEqual({'A1': ['A1'], 'A2': ['A2', 'C3'], 'A3': ['A3']},
                              self.test_model._Model__intentions)
 
+        # Remove a consequence which is part of a mechanism
+        self.test_model._Model__mechanisms['C4'].append('C3')
+        self.test_model.remove_consequences('C3')
+        self.assertDictEqual({'C4': ['A2']},
+                             self.test_model._Model__mechanisms)
+
         # Error raising
         self.assertRaises(TypeError, self.test_model.remove_consequences, 42)
 
@@ -283,9 +470,8 @@ class TestModel(unittest.TestCase):
         self.assertDictEqual({'C5': ['B1', 'A1'], 'C2': ['A1'],
                               'C3': ['B1', 'A2'], 'C4': ['A2']},
                              self.test_model._Model__mechanisms)
-        self.assertDictEqual({'C5': 10, 'C2': -4, 'C3': 10, 'C4': -4,
-                              'Not(\'C5\')': -10, 'Not(\'C2\')': 4,
-                              'Not(\'C3\')': -10, 'Not(\'C4\')': 4},
+        self.assertDictEqual({'C5': [10, -10], 'C2': [-4, 4],
+                              'C3': [10, -10], 'C4': [-4, 4]},
                              self.test_model._Model__utilities)
         self.assertDictEqual({'A1': ['A1', 'C5'], 'A2': ['A2', 'C3'],
                               'A3': ['A3']}, self.test_model._Model__intentions)
@@ -322,6 +508,26 @@ class TestModel(unittest.TestCase):
         self.assertRaises(TypeError, self.test_model.add_mechanisms, 42, 'C1')
         self.assertRaises(KeyError, self.test_model.add_mechanisms, 'C5', 'A1')
 
+        # Cyclic mechanisms
+        self.test_model.add_consequences('C5')
+        self.test_model.add_mechanisms('C5', 'C1')
+        self.test_model.add_mechanisms('C4', 'C5')
+        self.assertRaises(ValueError, self.test_model.add_mechanisms, 'C1',
+                          'C4')
+        self.assertRaises(ValueError, self.test_model.add_mechanisms, 'C1',
+                          'C1')
+        self.assertListEqual(['B1', 'A1'],
+                             self.test_model._Model__mechanisms['C1'])
+
+        # Rejected calls leave the mechanism unchanged
+        self.assertRaises(ValueError, self.test_model.add_mechanisms, 'C1',
+                          'A3', 'C4')
+        self.assertRaises(KeyError, self.test_model.add_mechanisms, 'C1',
+                          'A3', 'A4')
+        self.assertListEqual(['B1', 'A1'],
+                             self.test_model._Model__mechanisms['C1'])
+        self.assertListEqual(['A3'], self.test_model.check()['unused_actions'])
+
     def test_remove_mechanisms(self):
         '''Test remove_mechanism method.'''
         # Remove single mechanism
@@ -345,18 +551,22 @@ class TestModel(unittest.TestCase):
         '''Test set_utility method.'''
         # Set a simple utility
         self.test_model.set_utility('C1', 42)
-        self.assertDictEqual({'C1': 42, 'C2': -4, 'C3': 10, 'C4': -4,
-                              'Not(\'C1\')': -10, 'Not(\'C2\')': 4,
-                              'Not(\'C3\')': -10, 'Not(\'C4\')': 4},
+        self.assertDictEqual({'C1': [42, -10], 'C2': [-4, 4],
+                              'C3': [10, -10], 'C4': [-4, 4]},
                              self.test_model._Model__utilities)
 
         # Set a Not utility
         self.test_model.set_utility('C1', 23, False)
-        self.assertDictEqual({'C1': 42, 'C2': -4, 'C3': 10, 'C4': -4,
-                              'Not(\'C1\')': 23, 'Not(\'C2\')': 4,
-                              'Not(\'C3\')': -10, 'Not(\'C4\')': 4},
+        self.assertDictEqual({'C1': [42, 23], 'C2': [-4, 4],
+                              'C3': [10, -10], 'C4': [-4, 4]},
                              self.test_model._Model__utilities)
 
+        # Set a utility of a consequence without utilities
+        self.test_model.add_consequences('C6')
+        self.test_model.set_utility('C6', 7, False)
+        self.assertListEqual([None, 7],
+                             self.test_model._Model__utilities['C6'])
+
         # Error raising
         self.assertRaises(TypeError, self.test_model.set_utility, 'C1', '42')
         self.assertRaises(TypeError, self.test_model.set_utility, 23, 42)
@@ -366,20 +576,36 @@ class TestModel(unittest.TestCase):
         '''Test remove_utility method.'''
         # Remove a simple utility
         self.test_model.remove_utility('C1')
-        self.assertDictEqual({'C2': -4, 'C3': 10, 'C4': -4,
-                              'Not(\'C1\')': -10, 'Not(\'C2\')': 4,
-                              'Not(\'C3\')': -10, 'Not(\'C4\')': 4},
+        self.assertDictEqual({'C1': [None, -10], 'C2': [-4, 4],
+                              'C3': [10, -10], 'C4': [-4, 4]},
                              self.test_model._Model__utilities)
 
         # Remove a Not utility
         self.test_model.remove_utility('C1', False)
-        self.assertDictEqual({'C2': -4, 'C3': 10, 'C4': -4, 'Not(\'C2\')': 4,
-                              'Not(\'C3\')': -10, 'Not(\'C4\')': 4},
+        self.assertDictEqual({'C2': [-4, 4], 'C3': [10, -10], 'C4': [-4, 4]},
                              self.test_model._Model__utilities)
 
         # Error raising
         self.assertRaises(TypeError, self.test_model.remove_utility, 42)
 
+    def test_get_utilities(self):
+        '''Test get_utilities, get_utility_pairs and get_utility_vectors
+        methods.'''
+        self.test_model.add_consequences('C5')
+        self.test_model.remove_utility('C2', False)
+
+        self.assertDictEqual({'C1': 10, 'C2': -4, 'C3': 10, 'C4': -4,
+                              'Not(\'C1\')': -10, 'Not(\'C3\')': -10,
+                              'Not(\'C4\')': 4},
+                             self.test_model.get_utilities())
+        self.assertDictEqual({'C1': (10, -10), 'C2': (-4, None),
+                              'C3': (10, -10), 'C4': (-4, 4)},
+                             self.test_model.get_utility_pairs())
+        self.assertTupleEqual(([10, -4, 10, -4, 0], [-10, 0, -10, 4, 0]),
+                              self.test_model.get_utility_vectors())
+        self.assertListEqual([-10, None, -10, 4, None],
+                             self.test_model.get_utility_vectors(None)[1])
+
     # INTENTIONS ---------------------------------------------------------------
     def test_add_intentions(self):
         '''Test add_intentions method.'''
@@ -422,5 +648,879 @@ class TestModel(unittest.TestCase):
         self.assertRaises(TypeError, self.test_model.remove_intentions,
                           'A1', 42)
 
+    def test_get_intenders(self):
+        '''Test intends, get_intending_actions and get_intenders methods.'''
+        self.test_model.add_intentions('A3', 'C3', 'C1')
+        self.assertListEqual(['A1', 'A3'],
+                             self.test_model.get_intending_actions('C1'))
+        self.assertListEqual([], self.test_model.get_intending_actions('C2'))
+        self.assertListEqual([], self.test_model.get_intending_actions('C5'))
+        self.assertTrue(self.test_model.intends('A2', 'C3'))
+        self.assertFalse(self.test_model.intends('A1', 'C3'))
+        self.assertDictEqual({'C1': ['A1', 'A3'], 'C3': ['A2', 'A3']},
+                             self.test_model.get_intenders())
+
+        # The index is kept up to date
+        self.test_model.remove_intentions('A3', 'C3')
+        self.test_model.rename_action('A1', 'A4')
+        self.test_model.rename_consequence('C1', 'C5')
+        self.test_model.add_intentions('A2', 'C2')
+        self.test_model.remove_actions('A2')
+        self.assertDictEqual({'C5': ['A3', 'A4'], 'C2': [], 'C3': []},
+                             self.test_model.get_intenders(['C5', 'C2', 'C3']))
+        self.test_model.remove_consequences('C5')
+        self.test_model.add_actions('A5')
+        self.test_model.add_intentions('A5', 'C2', 'C4')
+        self.assertDictEqual({'A3': ['A3'], 'A4': ['A4'],
+                              'A5': ['A5', 'C2', 'C4']},
+                             self.test_model.get_intentions())
+        self.assertDictEqual({'C2': ['A5'], 'C4': ['A5']},
+                             self.test_model.get_intenders())
+
+        # Error raising
+        self.assertRaises(TypeError, self.test_model.get_intending_actions, 42)
+        self.assertRaises(TypeError, self.test_model.get_intenders, [42])
+        self.assertRaises(TypeError, self.test_model.intends, 42, 'C2')
+
+    # CAUSALITY ----------------------------------------------------------------
+    def test_evaluate(self):
+        '''Test evaluate method.'''
+        assignment = {'A1': 1, 'A2': 0, 'A3': 0, 'B1': 1}
+        self.assertDictEqual({'C1': 1, 'C2': 1, 'C3': 0, 'C4': 0},
+                             self.test_model.evaluate(assignment))
+
+        # Consequences within mechanisms and consequences without mechanism
+        self.test_model.add_consequences('C5', 'C6')
+        self.test_model.add_mechanisms('C5', 'C1', 'A3')
+        self.assertDictEqual({'C1': 1, 'C2': 1, 'C3': 0, 'C4': 0, 'C5': 0,
+                              'C6': 0},
+                             self.test_model.evaluate(assignment))
+        assignment['A3'] = 1
+        self.assertEqual(1, self.test_model.evaluate(assignment)['C5'])
+
+        # Cached supports are updated when mechanisms change
+        self.test_model.remove_mechanisms('C5', 'A3')
+        assignment['A3'] = 0
+        self.assertEqual(1, self.test_model.evaluate(assignment)['C5'])
+
+        # Changes made before an argument is rejected update the cache as well
+        self.assertRaises(TypeError, self.test_model.add_consequences, 'C7', 42)
+        self.assertEqual(0, self.test_model.evaluate(assignment)['C7'])
+        self.assertRaises(KeyError, self.test_model.remove_mechanisms, 'C8',
+                          'A1')
+        self.assertRaises(KeyError, self.test_model.add_mechanisms, 'C7', 'A1',
+                          'A4')
+        self.assertEqual(0, self.test_model.evaluate(assignment)['C7'])
+
+        # Error raising
+        self.assertRaises(KeyError, self.test_model.evaluate, {'A1': 1})
+        self.assertRaises(ValueError, self.test_model.evaluate,
+                          {'A1': 2, 'A2': 0, 'A3': 0, 'B1': 1})
+
+    def test_estimate(self):
+        '''Test estimate method.'''
+        self.test_model.add_consequences('C5')
+        self.test_model.add_mechanisms('C5', 'C1', 'A3')
+        self.test_model.set_utility('C5', 8)
+
+        result = self.test_model.estimate({'B1': 0.25}, ['A1', 'A3'],
+                                          batch_size=2048, max_samples=16384,
+                                          seed=0)
+        self.assertEqual(16384, result['samples'])
+        self.assertFalse(result['converged'])
+
+        # Performing A1 reaches C1 only if B1 holds, which it does in about a
+        # fourth of the samples
+        estimates = result['actions']['A1']
+        c1 = estimates['consequences']['C1']
+        self.assertLess(c1['low'], c1['probability'])
+        self.assertLess(c1['low'], 0.25)
+        self.assertLess(0.25, c1['high'])
+        self.assertEqual(1.0, estimates['consequences']['C2']['probability'])
+        self.assertEqual(0.0, estimates['consequences']['C5']['probability'])
+
+        # Expected utility: 0.25 * 10 + 0.75 * -10 - 4 - 10 + 4
+        utility = estimates['utility']
+        self.assertLess(utility['low'], -15)
+        self.assertLess(-15, utility['high'])
+
+        # Without uncertainty, the estimates are exact
+        result = self.test_model.estimate({'B1': 1}, ['A3'], batch_size=64,
+                                          utility_tolerance=0.1, seed=0)
+        self.assertTrue(result['converged'])
+        self.assertEqual(128, result['samples'])
+        self.assertEqual({'mean': -12, 'low': -12, 'high': -12},
+                         result['actions']['A3']['utility'])
+
+        # The tolerances of probabilities and utilities are separate
+        result = self.test_model.estimate({'B1': 0.25}, ['A1'],
+                                          probability_tolerance=0.05,
+                                          seed=0)
+        self.assertTrue(result['converged'])
+        c1 = result['actions']['A1']['consequences']['C1']
+        self.assertLessEqual(c1['high'] - c1['low'], 0.1)
+        self.assertGreater(result['actions']['A1']['utility']['high']
+                           - result['actions']['A1']['utility']['low'], 0.1)
+        result = self.test_model.estimate({'B1': 0.25}, ['A1'],
+                                          max_samples=4096,
+                                          probability_tolerance=0.05,
+                                          utility_tolerance=0.1, seed=0)
+        self.assertFalse(result['converged'])
+
+        # Bits are sampled with any probability
+        for probability in (0.1, 0.7, 1e-3):
+            result = self.test_model.estimate({'B1': probability}, ['A1'],
+                                              max_samples=65536, seed=1)
+            c1 = result['actions']['A1']['consequences']['C1']
+            self.assertLess(c1['low'], probability)
+            self.assertLess(probability, c1['high'])
+
+        # Actions given twice are estimated once
+        result = self.test_model.estimate({'B1': 0.25}, ['A1', 'A1'],
+                                          max_samples=4096, seed=0)
+        self.assertDictEqual(
+            self.test_model.estimate({'B1': 0.25}, ['A1'], max_samples=4096,
+                                     seed=0),
+            result)
+
+        # Error raising
+        self.assertRaises(KeyError, self.test_model.estimate, {'B2': 0.5})
+        self.assertRaises(ValueError, self.test_model.estimate, {'B1': 2})
+        self.assertRaises(TypeError, self.test_model.estimate, {'B1': '1'})
+        self.assertRaises(KeyError, self.test_model.estimate, None, ['A4'])
+        self.assertRaises(ValueError, self.test_model.estimate,
+                          batch_size=0)
+        self.assertRaises(ValueError, self.test_model.estimate,
+                          utility_tolerance=0)
+
+    def test_get_supports(self):
+        '''Test get_supports method.'''
+        self.test_model.add_consequences('C5', 'C6')
+        self.test_model.add_mechanisms('C5', 'C1', 'A3')
+
+        self.assertDictEqual({'C1': ['A1', 'B1'], 'C2': ['A1'],
+                              'C3': ['A2', 'B1'], 'C4': ['A2'],
+                              'C5': ['A1', 'A3', 'B1'], 'C6': None},
+                             self.test_model.get_supports())
+
+    def test_get_but_for_causes(self):
+        '''Test get_but_for_causes method.'''
+        assignment = {'A1': 1, 'A2': 0, 'A3': 0, 'B1': 1}
+        self.test_model.add_consequences('C5')
+        self.test_model.add_mechanisms('C5', 'C1', 'A3')
+
+        # Consequences that hold
+        self.assertListEqual(['A1', 'B1'],
+                             self.test_model.get_but_for_causes('C1',
+                                                                assignment))
+        # Consequences that do not hold
+        self.assertListEqual(['A2'],
+                             self.test_model.get_but_for_causes('C3',
+                                                                assignment))
+        self.assertListEqual(['A3'],
+                             self.test_model.get_but_for_causes('C5',
+                                                                assignment))
+        assignment['B1'] = 0
+        self.assertListEqual([],
+                             self.test_model.get_but_for_causes('C5',
+                                                                assignment))
+
+        # Error raising
+        self.assertRaises(KeyError, self.test_model.get_but_for_causes, 'C6',
+                          assignment)
+
+    def test_get_sufficient_sets(self):
+        '''Test get_sufficient_sets method.'''
+        assignment = {'A1': 1, 'A2': 0, 'A3': 1, 'B1': 1}
+        self.test_model.add_consequences('C5')
+        self.test_model.add_mechanisms('C5', 'C1', 'A3')
+
+        self.assertListEqual([['A1', 'A3', 'B1']],
+                             self.test_model.get_sufficient_sets('C5',
+                                                                 assignment))
+        self.assertListEqual([],
+                             self.test_model.get_sufficient_sets('C3',
+                                                                 assignment))
+
+    # MERGING ------------------------------------------------------------------
+    def test_diff(self):
+        '''Test diff and apply_patch methods.'''
+        other = snapshot.loads(snapshot.dumps(self.test_model))
+        self.assertDictEqual({}, self.test_model.diff(other))
+
+        other.set_description('Other')
+        other.remove_actions('A3')
+        other.add_actions('A4')
+        other.add_background('B2')
+        other.remove_consequences('C4')
+        other.add_consequences('C5')
+        other.add_mechanisms('C5', 'C1', 'A4')
+        other.remove_mechanisms('C1', 'B1')
+        other.add_mechanisms('C1', 'B2')
+        other.set_utility('C1', 5)
+        other.remove_utility('C2', False)
+        other.set_utility('C5', 1, False)
+        other.add_intentions('A4', 'C5')
+        other.remove_intentions('A2', 'C3')
+
+        patch = self.test_model.diff(other)
+        self.assertDictEqual({
+            'description': 'Other',
+            'remove': {'actions': ['A3'], 'consequences': ['C4'],
+                       'mechanisms': {'C1': ['B1']},
+                       'intentions': {'A2': ['C3']}},
+            'add': {'actions': ['A4'], 'background': ['B2'],
+                    'consequences': ['C5'],
+                    'mechanisms': {'C1': ['B2'], 'C5': ['C1', 'A4']},
+                    'intentions': {'A4': ['C5']}},
+            'utilities': {'C1': [5, -10], 'C2': [-4, None],
+                          'C5': [None, 1]},
+            }, patch)
+
+        # The patch is applied after a round trip through json
+        self.test_model.apply_patch(json.loads(json.dumps(patch)))
+        self.assertEqual(other, self.test_model)
+        self.assertEqual('Other', self.test_model.get_description())
+        self.assertDictEqual({}, self.test_model.diff(other))
+        self.assertDictEqual({}, other.diff(self.test_model))
+        self.assertEqual(other.get_fingerprint(),
+                         self.test_model.get_fingerprint())
+        self.assertDictEqual(other.check(), self.test_model.check())
+
+        # A variable changing its kind is removed from mechanisms and added
+        # again
+        other.remove_actions('A1')
+        other.add_consequences('A1')
+        other.add_mechanisms('C2', 'A1')
+        self.test_model.apply_patch(self.test_model.diff(other))
+        self.assertEqual(other, self.test_model)
+
+        # Invalid patches are not applied at all
+        fingerprint = self.test_model.get_fingerprint()
+        self.assertRaises(KeyError, self.test_model.apply_patch,
+                          {'add': {'actions': ['A5'],
+                                   'mechanisms': {'C6': ['A5']}}})
+        self.assertRaises(TypeError, self.test_model.apply_patch,
+                          {'utilities': {'C1': ['5', None]}})
+        self.assertRaises(ValueError, self.test_model.apply_patch,
+                          {'add': {'mechanisms': {'C1': ['C5']}}})
+        self.assertEqual(fingerprint, self.test_model.get_fingerprint())
+        self.assertNotIn('A5', self.test_model.get_actions())
+        self.assertEqual(other, self.test_model)
+
+    def test_merge(self):
+        '''Test merge method.'''
+        other = Model('Other')
+        other.add_actions('A4')
+        other.add_background('A1')
+        other.add_consequences('C1', 'C2', 'C5')
+        other.add_mechanisms('C1', 'A4')
+        other.add_mechanisms('C5', 'C2', 'A4')
+        other.set_utility('C1', 10)
+        other.set_utility('C1', 0, False)
+        other.set_utility('C2', 3)
+        other.set_utility('C5', 1)
+        other.add_intentions('A4', 'C2', 'C5')
+
+        conflicts = self.test_model.merge(other)
+        self.assertListEqual([
+            {'kind': 'variable', 'name': 'A1', 'self': 'actions',
+             'other': 'background'},
+            {'kind': 'mechanism', 'name': 'C1', 'self': ['A1', 'B1'],
+             'other': ['A4']},
+            {'kind': 'utility', 'name': 'C1', 'self': [10, -10],
+             'other': [10, 0]},
+            {'kind': 'utility', 'name': 'C2', 'self': [-4, 4],
+             'other': [3, None]},
+            ], conflicts)
+
+        # Conflicts are kept, everything else is added
+        self.assertEqual('Test', self.test_model.get_description())
+        self.assertListEqual(['A1', 'A2', 'A3', 'A4'],
+                             self.test_model.get_actions())
+        self.assertListEqual(['B1'], self.test_model.get_background())
+        self.assertListEqual(['B1', 'A1'],
+                             self.test_model.get_mechanisms()['C1'])
+        self.assertListEqual(['C2', 'A4'],
+                             self.test_model.get_mechanisms()['C5'])
+        self.assertTupleEqual((10, -10),
+                              self.test_model.get_utility_pairs()['C1'])
+        self.assertTupleEqual((1, None),
+                              self.test_model.get_utility_pairs()['C5'])
+        self.assertListEqual(['A4', 'C2', 'C5'],
+                             self.test_model.get_intentions()['A4'])
+
+        # Merging again only reports the conflicts, which are taken from the
+        # other model, if they are overwritten
+        fingerprint = self.test_model.get_fingerprint()
+        self.assertListEqual(conflicts, self.test_model.merge(other))
+        self.assertEqual(fingerprint, self.test_model.get_fingerprint())
+        self.assertListEqual(conflicts, self.test_model.merge(other, True))
+        self.assertListEqual(['A4'], self.test_model.get_mechanisms()['C1'])
+        self.assertDictEqual({'C1': (10, 0), 'C2': (3, 4)},
+                             {key: self.test_model.get_utility_pairs()[key]
+                              for key in ('C1', 'C2')})
+
+        # Merges making the mechanisms cyclic are rejected
+        self.test_model.add_consequences('C6', 'C7')
+        self.test_model.add_mechanisms('C7', 'C6')
+        other.add_consequences('C6', 'C7')
+        other.add_mechanisms('C6', 'C7')
+        fingerprint = self.test_model.get_fingerprint()
+        self.assertRaises(ValueError, self.test_model.merge, other)
+        self.assertEqual(fingerprint, self.test_model.get_fingerprint())
+        self.assertListEqual([], self.test_model.get_mechanisms()['C6'])
+
+    def test_thread_safety(self):
+        '''Test that readers of a shared model never see partial changes.'''
+        model = Model('Test', thread_safe=True)
+        model.add_actions('A1', 'A2')
+        model.add_consequences('C1', 'C2')
+        model.add_mechanisms('C1', 'A1')
+        model.add_mechanisms('C2', 'C1', 'A2')
+        model.set_utility('C1', 1)
+        model.set_utility('C2', -1, False)
+        model.add_intentions('A1', 'C1')
+        errors = []
+        done = threading.Event()
+
+        def write():
+            for iteration in range(200):
+                model.rename_consequence('C1', 'C3')
+                model.rename_consequence('C3', 'C1')
+                model.remove_consequences('C2')
+                model.add_consequences('C2')
+                model.add_mechanisms('C2', 'C1', 'A2')
+                model.set_utility('C2', -1, False)
+
+        def read():
+            while not done.is_set():
+                content = json.loads(repr(model))
+                consequences = content['consequences']
+                if set(content['mechanisms']) != set(consequences):
+                    errors.append(content)
+                if not all(key in consequences or key[5:-2] in consequences
+                           for key in content['utilities']):
+                    errors.append(content)
+                model.check()
+                if model != model:
+                    errors.append(content)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        write()
+        done.set()
+        for reader in readers:
+            reader.join()
+
+        self.assertListEqual([], errors)
+        self.assertListEqual(['A1', 'A2'], model.get_actions())
+        self.assertDictEqual({'C1': ['A1'], 'C2': ['C1', 'A2']},
+                             model.get_mechanisms())
+
+        # A reader must not become a writer
+        with model._Model__lock.reading:
+            self.assertRaises(RuntimeError, model.add_actions, 'A3')
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.test_model = Model('Test')
+        self.test_model.add_actions('A1', 'A2')
+        self.test_model.add_background('B1')
+        self.test_model.add_consequences('C1', 'C2')
+        self.test_model.add_mechanisms('C1', 'A1', 'B1')
+        self.test_model.add_mechanisms('C2', 'C1')
+        self.test_model.set_utility('C1', 3)
+        self.test_model.set_utility('C2', -2, False)
+        self.test_model.add_intentions('A1', 'C1')
+
+    def test_dumps(self):
+        '''Test dumps and loads functions.'''
+        loaded = snapshot.loads(snapshot.dumps(self.test_model))
+
+        self.assertEqual(self.test_model, loaded)
+        self.assertEqual(repr(self.test_model), repr(loaded))
+
+        # Loaded models can be changed like any other model
+        loaded.rename_consequence('C1', 'C3')
+        self.assertDictEqual({'C3': ['A1', 'B1'], 'C2': ['C3']},
+                             loaded.get_mechanisms())
+
+        # Error raising
+        self.assertRaises(ValueError, snapshot.loads, b'JSON' + bytes(64))
+        self.assertRaises(ValueError, snapshot.loads, b'HERA')
+
+        # Every truncated section is rejected
+        content = snapshot.dumps(self.test_model)
+        for length in range(len(content)):
+            self.assertRaises(ValueError, snapshot.loads, content[:length])
+
+        # Snapshots of invalid models are rejected, here C1 depends on itself
+        model = Model('Test')
+        model.add_consequences('C1', 'C2')
+        model.add_mechanisms('C2', 'C1')
+        content = snapshot.dumps(model).replace(struct.pack('<3I', 0, 0, 1),
+                                                struct.pack('<3I', 0, 1, 1))
+        self.assertRaises(ValueError, snapshot.loads, content)
+
+        # Utilities must fit into int64 values
+        self.test_model.set_utility('C1', 2 ** 63)
+        self.assertRaises(ValueError, snapshot.dumps, self.test_model)
+
+    def test_open_snapshot(self):
+        '''Test lazily reading a snapshot file.'''
+        tmp_fd, filename = tempfile.mkstemp()
+        os.close(tmp_fd)
+        self.addCleanup(os.remove, filename)
+        snapshot.save(self.test_model, filename)
+
+        with snapshot.open_snapshot(filename) as snap:
+            self.assertEqual('Test', snap.get_description())
+            self.assertListEqual(['A1', 'A2'], snap.get_actions())
+            self.assertDictEqual({'C1': 3, 'Not(\'C2\')': -2},
+                                 snap.get_utilities())
+            self.assertDictEqual({'A1': ['A1', 'C1'], 'A2': ['A2']},
+                                 snap.get_intentions())
+
+        self.assertEqual(self.test_model, snapshot.load(filename))
+
+        # Invalid and truncated files
+        content = snapshot.dumps(self.test_model)
+        for data in (b'JSON' + content[4:], content[:70]):
+            with open(filename, 'wb') as snapshot_file:
+                snapshot_file.write(data)
+            self.assertRaises(ValueError, snapshot.open_snapshot, filename)
+
+class TestTableStore(unittest.TestCase):
+    def setUp(self):
+        self.test_model = Model('Test')
+        self.test_model.add_actions('A1', 'A2')
+        self.test_model.add_background('B1')
+        self.test_model.add_consequences('C1', 'C2', 'C3')
+        self.test_model.add_mechanisms('C1', 'A1', 'B1')
+        self.test_model.add_mechanisms('C2', 'C1', 'A2')
+        self.test_model.set_utility('C1', 3)
+        self.test_model.set_utility('C2', -2, False)
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.store = TableStore(tmp_dir.name)
+        self.addCleanup(self.store.close)
+
+    def test_get_table(self):
+        '''Test get_table method.'''
+        assignment = {'A1': 1, 'A2': 0, 'B1': 1}
+        table = self.store.get_table(self.test_model)
+
+        self.assertEqual(self.test_model.get_fingerprint(),
+                         table.get_fingerprint())
+        self.assertDictEqual(self.test_model.evaluate(assignment),
+                             table.evaluate(assignment))
+        self.assertDictEqual(self.test_model.get_utilities(),
+                             table.get_utilities())
+        self.assertEqual(1, table.get_utility(assignment))
+        self.assertIs(table, self.store.get_table(self.test_model))
+
+        # Another store attaches to the table file of the first one
+        with TableStore(self.store.get_directory()) as other_store:
+            self.assertDictEqual(
+                {'C1': 1, 'C2': 1, 'C3': 0},
+                other_store.get_table(self.test_model).evaluate(
+                    {'A1': 1, 'A2': 1, 'B1': 1}))
+
+        # A changed model gets a new table
+        self.test_model.remove_mechanisms('C2', 'A2')
+        table = self.store.get_table(self.test_model)
+        self.assertEqual(1, table.evaluate(assignment)['C2'])
+        self.assertEqual(2, len(os.listdir(self.store.get_directory())))
+
+    def test_max_tables(self):
+        '''Test that a store keeps a bounded number of tables and files.'''
+        with TableStore(self.store.get_directory(), max_tables=2) as store:
+            for value in range(5):
+                self.test_model.set_utility('C3', value)
+                table = store.get_table(self.test_model)
+                self.assertEqual(value, table.get_utilities()['C3'])
+            self.assertEqual(2, len(os.listdir(store.get_directory())))
+
+            # A removed file is written again
+            for filename in os.listdir(store.get_directory()):
+                os.remove(os.path.join(store.get_directory(), filename))
+            self.test_model.set_utility('C3', 2)
+            self.assertEqual(2, store.get_table(
+                self.test_model).get_utilities()['C3'])
+
+        self.assertRaises(ValueError, TableStore, max_tables=0)
+
+    def test_corrupt_table(self):
+        '''Test that corrupt table files are rejected.'''
+        filename = os.path.join(
+            self.store.get_directory(),
+            '{:032x}.table'.format(self.test_model.get_fingerprint()))
+        content = tables.dumps(self.test_model)
+
+        for data in (b'JSON' + content[4:], content[:60], content[:-8]):
+            with open(filename, 'wb') as table_file:
+                table_file.write(data)
+            self.assertRaises(ValueError, self.store.get_table,
+                              self.test_model)
+
+        # A file holding the table of another model is written again
+        other = snapshot.loads(snapshot.dumps(self.test_model))
+        other.set_utility('C3', 5)
+        with open(filename, 'wb') as table_file:
+            table_file.write(tables.dumps(other))
+        self.assertEqual(self.test_model.get_fingerprint(),
+                         self.store.get_table(self.test_model)
+                         .get_fingerprint())
+
+    def test_changed_model(self):
+        '''Test that a table is filed under the fingerprint of its content.'''
+        old_fingerprint = self.test_model.get_fingerprint()
+        self.test_model.set_utility('C3', 5)
+        fingerprints = [old_fingerprint]
+
+        # The model is changed after get_table got its fingerprint
+        def get_fingerprint():
+            if fingerprints:
+                return fingerprints.pop()
+            return Model.get_fingerprint(self.test_model)
+        self.test_model.get_fingerprint = get_fingerprint
+
+        table = self.store.get_table(self.test_model)
+        self.assertEqual(Model.get_fingerprint(self.test_model),
+                         table.get_fingerprint())
+        self.assertEqual(5, table.get_utilities()['C3'])
+        self.assertListEqual(
+            ['{:032x}.table'.format(table.get_fingerprint())],
+            os.listdir(self.store.get_directory()))
+
+class TestLRUCache(unittest.TestCase):
+    def test_cache(self):
+        '''Test get and put methods.'''
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+
+        # The least recently used entry is evicted
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+        self.assertDictEqual({'hits': 2, 'misses': 1, 'evictions': 1,
+                              'expirations': 0, 'size': 2, 'maxsize': 2},
+                             cache.get_stats())
+
+        # Error raising
+        self.assertRaises(TypeError, LRUCache, '2')
+        self.assertRaises(ValueError, LRUCache, 0)
+        self.assertRaises(TypeError, LRUCache, 2, '1')
+        self.assertRaises(ValueError, LRUCache, 2, 0)
+
+    def test_ttl(self):
+        '''Test the expiration of entries.'''
+        cache = LRUCache(10, ttl=0.05)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+
+        time.sleep(0.06)
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.get('a'))
+
+        # Expired entries are dropped when new entries are put
+        cache.put('c', 3)
+        self.assertEqual(1, len(cache))
+        self.assertEqual(3, cache.get('c'))
+        self.assertDictEqual({'hits': 2, 'misses': 1, 'evictions': 0,
+                              'expirations': 2, 'size': 1, 'maxsize': 10},
+                             cache.get_stats())
+
+        # Expired entries behind recently used ones are dropped as well
+        cache.put('d', 4)
+        time.sleep(0.03)
+        cache.put('e', 5)
+        cache.get('c')
+        time.sleep(0.03)
+        cache.put('f', 6)
+        self.assertEqual(2, len(cache))
+        self.assertNotIn('c', cache)
+        self.assertEqual(5, cache.get('e'))
+
+    def test_threads(self):
+        '''Test that threads can use the cache at the same time.'''
+        cache = LRUCache(4)
+        errors = []
+
+        def use(offset):
+            try:
+                for index in range(2000):
+                    key = (offset + index) % 6
+                    if cache.get(key) not in (None, key):
+                        errors.append(key)
+                    cache.put(key, key)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=use, args=(offset,))
+                   for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertListEqual([], errors)
+        self.assertEqual(4, len(cache))
+        self.assertEqual(16000, cache.get_stats()['hits']
+                         + cache.get_stats()['misses'])
+
+class TestStats(unittest.TestCase):
+    def tearDown(self):
+        stats.disable()
+        stats.reset()
+
+    def test_instrumentation(self):
+        '''Test enabling, disabling and reading the instrumentation.'''
+        model = Model('Test')
+        add_actions = Model.add_actions
+
+        # Disabled instrumentation leaves the methods untouched
+        model.add_actions('A1')
+        self.assertIs(add_actions, Model.add_actions)
+        self.assertDictEqual({}, stats.get_stats())
+
+        stats.enable()
+        model.add_actions('A2', 'A3')
+        model.add_actions('A4')
+        with stats.measure('stage'):
+            pass
+        record = stats.get_stats()['Model.add_actions']
+        self.assertEqual(2, record['calls'])
+        self.assertEqual(2, sum(record['histogram'].values()))
+        self.assertLessEqual(record['max_seconds'], record['total_seconds'])
+        self.assertEqual(1, stats.get_stats()['stage']['calls'])
+
+        stats.disable()
+        self.assertIs(add_actions, Model.add_actions)
+        model.add_actions('A5')
+        self.assertEqual(2, stats.get_stats()['Model.add_actions']['calls'])
+
+        stats.reset()
+        self.assertDictEqual({}, stats.get_stats())
+
+    def test_threads(self):
+        '''Test enabling and disabling the instrumentation from threads.'''
+        add_actions = Model.add_actions
+
+        def toggle():
+            for _ in range(200):
+                stats.enable()
+                stats.disable()
+
+        threads = [threading.Thread(target=toggle) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIs(add_actions, Model.add_actions)
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher(Model('Test'))
+        self.message_id = 0
+
+    def tearDown(self):
+        stats.disable()
+        stats.reset()
+
+    def request(self, field, method, arguments=None):
+        '''Send a request to the dispatcher and return the result.'''
+        self.message_id += 1
+        reply = self.dispatcher.handle({
+            'id': self.message_id,
+            'type': 'request',
+            'query': {'field': field, 'method': method,
+                      'arguments': arguments},
+            })
+        self.assertEqual('reply', reply['type'])
+        self.assertEqual(self.message_id, reply['query']['reply_to'])
+
+        return reply['query']['result']
+
+    def test_handle(self):
+        '''Test handle method.'''
+        self.assertTrue(self.request('action', 'ADD', ['A1', 'A2']))
+        self.assertTrue(self.request('action', 'RENAME',
+                                     {'old': 'A2', 'new': 'A3'}))
+        self.assertListEqual(['A1', 'A3'], self.request('action', 'GET'))
+        self.assertTrue(self.request('consequence', 'ADD', ['C1']))
+        self.assertTrue(self.request('mechanism', 'ADD',
+                                     {'consequence': 'C1',
+                                      'variables': ['A1']}))
+        self.assertTrue(self.request('utility', 'SET',
+                                     {'consequence': 'C1', 'value': 4,
+                                      'affirmation': False}))
+        self.assertDictEqual({'C1': ['A1']}, self.request('mechanism', 'GET'))
+        self.assertDictEqual({'Not(\'C1\')': 4},
+                             self.request('utility', 'GET'))
+
+        # Failing requests
+        self.assertFalse(self.request('action', 'RENAME',
+                                      {'old': 'A4', 'new': 'A5'}))
+        self.assertFalse(self.request('mechanism', 'ADD',
+                                      {'consequence': 'C1'}))
+        self.assertFalse(self.request('action', 'FLY'))
+
+        # Statistics
+        self.assertTrue(self.request('stats', 'SET', True))
+        self.request('action', 'GET')
+        result = self.request('stats', 'GET')
+        self.assertEqual(1, result['protocol.action.GET']['calls'])
+        self.assertEqual(1, result['Model.get_actions']['calls'])
+        self.assertTrue(self.request('stats', 'SET', False))
+        self.assertFalse(stats.is_enabled())
+
+class TestClient(unittest.TestCase):
+    def test_request(self):
+        '''Test matching replies which arrive out of order and timeouts.'''
+        async def reply_in_reverse(reader, writer):
+            # Reply to the first two requests in reverse order and never to
+            # the third one
+            messages = [json.loads(await reader.readline()) for _ in range(2)]
+            for message in reversed(messages):
+                reply = {'id': 0, 'type': 'reply',
+                         'query': {'reply_to': message['id'],
+                                   'result': message['query']['arguments']}}
+                writer.write((json.dumps(reply) + '\n').encode())
+            await reader.readline()
+            await reader.read()
+            writer.close()
+
+        async def scenario():
+            server = await asyncio.start_server(reply_in_reverse, 'localhost',
+                                                0)
+            port = server.sockets[0].getsockname()[1]
+
+            async with client.Client('localhost', port, pool_size=1) as hera:
+                results = await asyncio.gather(
+                    hera.request('description', 'SET', 'first'),
+                    hera.request('description', 'SET', 'second'))
+                self.assertListEqual(['first', 'second'], results)
+
+                with self.assertRaises(asyncio.TimeoutError):
+                    await hera.request('action', 'GET', timeout=0.05)
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(scenario())
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(('localhost', 0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_replay(self):
+        '''Test replaying a session against the server.'''
+        session = [
+            (0.0, {'id': 1, 'type': 'request',
+                   'query': {'field': 'action', 'method': 'ADD',
+                             'arguments': ['A1']}}),
+            (0.01, {'id': 2, 'type': 'request',
+                    'query': {'field': 'action', 'method': 'GET',
+                              'arguments': None}}),
+            ]
+        report = loadtest.replay(session, self.server.server_address,
+                                 robots=3, speed=2, concurrency=2)
+
+        self.assertEqual(6, report['requests'])
+        self.assertListEqual(['action ADD', 'action GET'],
+                             list(report['latencies']))
+        self.assertEqual(3, report['latencies']['action GET']['count'])
+        self.assertListEqual(['A1'], self.server.get_model().get_actions())
+
+    def test_retransmission(self):
+        '''Test that retransmitted requests are handled only once.'''
+        message = {'id': 1, 'type': 'request', 'client': 'robot',
+                   'query': {'field': 'action', 'method': 'RENAME',
+                             'arguments': {'old': 'A1', 'new': 'A2'}}}
+        self.server.get_model().add_actions('A1')
+
+        reply = self.server.handle_message(message, 'robot')
+        self.assertTrue(reply['query']['result'])
+        self.assertDictEqual(reply, self.server.handle_message(message,
+                                                               'robot'))
+        self.assertListEqual(['A2'], self.server.get_model().get_actions())
+
+        # The same id of another client is a new request
+        self.assertFalse(self.server.handle_message(
+            message, 'other robot')['query']['result'])
+        self.assertEqual(1, self.server.get_reply_cache_stats()['hits'])
+
+        # Retransmissions on a connection
+        with socket.create_connection(self.server.server_address) as conn:
+            line = (json.dumps(dict(message, id=2, client='robot'))
+                    + '\n').encode()
+            conn.sendall(line + line)
+            replies = conn.makefile('rb')
+            first, second = replies.readline(), replies.readline()
+
+        self.assertEqual(first, second)
+        self.assertFalse(json.loads(first.decode())['query']['result'])
+
+        # Messages which are no json objects are ignored
+        with socket.create_connection(self.server.server_address) as conn:
+            conn.sendall(b'[1]\n"id"\n' + (json.dumps(dict(message, id=3))
+                                            + '\n').encode())
+            reply = json.loads(conn.makefile('rb').readline().decode())
+
+        self.assertEqual(3, reply['query']['reply_to'])
+
+    def test_workers(self):
+        '''Test that multiple workers with their own models are refused,
+        unless this is selected explicitly.'''
+        self.assertRaises(ValueError, server.serve, self.server, 2)
+
+        result = subprocess.run([sys.executable, 'server.py', '--port', '0',
+                                 '--workers', '2'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stderr=subprocess.PIPE, timeout=30)
+        self.assertEqual(2, result.returncode)
+        self.assertIn(b'--independent-workers', result.stderr)
+
+    def test_client(self):
+        '''Test the typed requests of the client against the server.'''
+        host, port = self.server.server_address
+
+        async def scenario():
+            async with client.Client(host, port, pool_size=2) as hera:
+                self.assertTrue(await hera.add_actions('A1', 'A2'))
+                self.assertTrue(await hera.rename_action('A2', 'A3'))
+                self.assertTrue(await hera.add_consequences('C1'))
+                self.assertTrue(await hera.add_mechanisms('C1', 'A1'))
+                self.assertTrue(await hera.set_utility('C1', 4, False))
+                self.assertFalse(await hera.rename_action('A4', 'A5'))
+
+                results = await asyncio.gather(*(hera.get_actions()
+                                                 for _ in range(20)))
+                self.assertListEqual([['A1', 'A3']] * 20, results)
+                self.assertDictEqual({'C1': ['A1']},
+                                     await hera.get_mechanisms())
+                self.assertDictEqual({'Not(\'C1\')': 4},
+                                     await hera.get_utilities())
+
+            report = await client.benchmark((host, port), requests=50,
+                                            concurrency=8, pool_size=2)
+            self.assertEqual(50, report['requests'])
+
+        asyncio.run(scenario())
+
 if __name__ == '__main__':
     unittest.main()